@@ -1,18 +1,62 @@
 """Application factory – creates and configures the Flask app."""
 
 import os
-from flask import Flask, render_template, jsonify, request, send_from_directory
+import tempfile
+import threading
+import time
+import orjson
+from flask import Flask, render_template, jsonify, request, send_from_directory, current_app
+from flask.json.provider import JSONProvider
 from sqlalchemy import text
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager
 from flask_wtf.csrf import CSRFProtect
 
+
+class OrjsonProvider(JSONProvider):
+    """JSON provider backed by orjson's C serializer.
+
+    Several times faster than the stdlib json path on the list-of-dicts
+    payloads the admin/API endpoints return; datetimes serialize natively.
+    """
+
+    def dumps(self, obj, **kwargs) -> str:
+        return orjson.dumps(obj, option=orjson.OPT_NAIVE_UTC).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+class ScratchSpoolRequest(Flask.request_class):
+    """Request class that spools multipart file parts onto the scratch dir.
+
+    Werkzeug's default stream factory spills parts over 500 KB to an
+    anonymous file in the platform temp dir — for a large upload that is a
+    full extra write + read on persistent disk before f.save() even runs.
+    Spooling to PLAINTEXT_SCRATCH_DIR (tmpfs when available) keeps that
+    staging copy in RAM, and the raised threshold keeps small uploads
+    entirely in a BytesIO buffer.
+    """
+
+    def _get_file_stream(self, total_content_length, content_type,
+                         filename=None, content_length=None):
+        return tempfile.SpooledTemporaryFile(
+            max_size=1024 * 1024, mode="rb+",
+            dir=current_app.config.get("PLAINTEXT_SCRATCH_DIR"),
+        )
+
+
 db = SQLAlchemy()
 login_manager = LoginManager()
 login_manager.login_view = "auth.login"
 login_manager.login_message_category = "info"
 csrf = CSRFProtect()
 
+# /health probe cache — liveness probes + open tabs poll this constantly;
+# coalesce concurrent probes into one DB round-trip every few seconds.
+_HEALTH_TTL_S = 5.0
+_health_cache = {"ts": 0.0, "healthy": None, "detail": None}
+_health_lock = threading.Lock()
+
 
 def create_app(config_name: str = "config.DevelopmentConfig") -> Flask:
     # Load environment variables from .env if present
@@ -23,30 +67,61 @@ def create_app(config_name: str = "config.DevelopmentConfig") -> Flask:
         pass
 
     app = Flask(__name__, template_folder="templates", static_folder="static")
+    app.request_class = ScratchSpoolRequest
     app.config.from_object(config_name)
+    app.json = OrjsonProvider(app)
 
     # Ensure storage directory exists
     os.makedirs(app.config["UPLOAD_FOLDER"], exist_ok=True)
 
+    # Frozen once so the per-upload extension check is a true O(1) set
+    # membership test regardless of how the config spells the collection
+    app.config["ALLOWED_EXTENSIONS"] = frozenset(app.config["ALLOWED_EXTENSIONS"])
+
+    # Explicit connection pooling — the default 5-connection QueuePool is the
+    # first thing to starve under concurrent dashboard traffic. SQLite
+    # (dev/tests) keeps its driver defaults, which reject QueuePool sizing.
+    if not app.config["SQLALCHEMY_DATABASE_URI"].startswith("sqlite"):
+        app.config.setdefault("SQLALCHEMY_ENGINE_OPTIONS", {
+            "pool_size": 10,
+            "max_overflow": 20,
+            "pool_timeout": 30,
+            "pool_recycle": 3600,
+            "pool_pre_ping": True,
+        })
+
     # Initialise extensions
     db.init_app(app)
     login_manager.init_app(app)
     csrf.init_app(app)
 
+    # Transparent brotli/gzip compression for HTML/JSON responses (config:
+    # COMPRESS_* in config.py). Optional — dev installs without it still run.
+    try:
+        from flask_compress import Compress
+        Compress(app)
+    except ImportError:
+        pass
+
     # Import models so SQLAlchemy knows about them
     from app.models import User, MediaFile, AuditLog, ShareToken  # noqa: F401
     from app.kms import KeyRecord, KeyShare  # noqa: F401
-    from app.policy import Policy, PolicyLog, PolicyType  # noqa: F401
+    from app.policy import Policy, PolicyLog, PolicyType, invalidate_policy_cache  # noqa: F401
+
+    # Module-level caches outlive app instances (tests build many apps per
+    # process) — start each app with a clean policy-decision cache
+    invalidate_policy_cache()
 
     # Register blueprints
     from app.auth.routes import auth_bp
     from app.media.routes import media_bp
-    from app.admin.routes import admin_bp
+    from app.admin.routes import admin_bp, admin_api_bp
     from app.sharing.routes import sharing_bp
 
     app.register_blueprint(auth_bp)
     app.register_blueprint(media_bp)
     app.register_blueprint(admin_bp)
+    app.register_blueprint(admin_api_bp)
     app.register_blueprint(sharing_bp)
 
     # ----- Error handlers -----
@@ -71,8 +146,8 @@ def create_app(config_name: str = "config.DevelopmentConfig") -> Flask:
             return jsonify({"error": "Internal server error"}), 500
         return render_template("errors/500.html"), 500
 
-    # Create tables on first request (dev convenience)
-    with app.app_context():
+    def _bootstrap_db():
+        """Create tables and seed the default admin + global policy."""
         db.create_all()
         try:
             from app.models import User
@@ -102,15 +177,56 @@ def create_app(config_name: str = "config.DevelopmentConfig") -> Flask:
         except Exception as e:
             app.logger.warning(f"Admin/policy auto-create skipped: {e}")
 
+        # Share lists moved from a CSV column to policy_allowed_users —
+        # copy any legacy grants over so existing shares keep working.
+        # No-op on fresh schemas (the legacy column doesn't exist).
+        try:
+            from app.policy import backfill_share_lists
+            migrated = backfill_share_lists()
+            if migrated:
+                app.logger.info(
+                    f"Backfilled {migrated} share grant(s) from legacy "
+                    "allowed_users column"
+                )
+        except Exception as e:
+            app.logger.warning(f"Share-list backfill skipped: {e}")
+
+    @app.cli.command("db-init")
+    def db_init_command():
+        """Create database tables and seed the default admin/policy."""
+        _bootstrap_db()
+        print("Database initialised.")
+
+    # Auto-create on startup is a dev/test convenience — production workers
+    # (AUTO_CREATE_TABLES=False) skip the per-fork schema round-trips and run
+    # `flask db-init` once at deploy time instead.
+    if app.config.get("AUTO_CREATE_TABLES", True):
+        with app.app_context():
+            _bootstrap_db()
+
     # ----- Health check endpoint (used by Docker / load balancers) -----
     @app.route("/health")
     def health_check():
-        """Lightweight health probe — returns 200 if app is alive."""
-        try:
-            db.session.execute(text("SELECT 1"))
+        """Lightweight health probe — returns 200 if app is alive.
+
+        The DB probe result is cached for a few seconds so load-balancer /
+        container probes don't hammer the connection pool.
+        """
+        if time.monotonic() - _health_cache["ts"] >= _HEALTH_TTL_S:
+            with _health_lock:
+                # Re-check under the lock: another thread may have refreshed
+                if time.monotonic() - _health_cache["ts"] >= _HEALTH_TTL_S:
+                    try:
+                        db.session.execute(text("SELECT 1"))
+                        _health_cache["healthy"] = True
+                        _health_cache["detail"] = "ok"
+                    except Exception as e:
+                        _health_cache["healthy"] = False
+                        _health_cache["detail"] = str(e)
+                    _health_cache["ts"] = time.monotonic()
+        if _health_cache["healthy"]:
             return jsonify({"status": "healthy", "db": "ok"}), 200
-        except Exception as e:
-            return jsonify({"status": "unhealthy", "db": str(e)}), 503
+        return jsonify({"status": "unhealthy", "db": _health_cache["detail"]}), 503
 
     # ----- Static hero background (served from project root) -----
     @app.route("/hero-bg.png")
@@ -1,17 +1,22 @@
 """Admin blueprint for key management, policy control, and share audit."""
 
+import hashlib
 from functools import wraps
 from datetime import datetime, timezone
 
-from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify
+from flask import (
+    Blueprint, render_template, request, redirect, url_for, flash,
+    jsonify, make_response,
+)
 from flask_login import login_required, current_user
+from sqlalchemy.orm import selectinload
 
 from app import db
 from app import csrf
 from app.models import User, MediaFile, AuditLog, ShareToken
 from app.kms import (
-    KeyRecord, KeyShare, get_key_info, list_keys, revoke_key, 
-    store_key, generate_file_key, retrieve_key
+    KeyRecord, KeyShare, get_key_info, list_keys, revoke_key,
+    store_key, generate_file_key, retrieve_key, _key_info
 )
 from app.policy import (
     Policy, PolicyLog, PolicyType, check_access, create_policy,
@@ -20,6 +25,32 @@ from app.policy import (
 
 admin_bp = Blueprint("admin", __name__, url_prefix="/admin")
 
+# JSON API endpoints live on their own blueprint so CSRF is exempted once
+# at the blueprint level — no per-request token generation/validation and
+# no @csrf.exempt boilerplate on every new endpoint.
+admin_api_bp = Blueprint("admin_api", __name__, url_prefix="/admin/api")
+csrf.exempt(admin_api_bp)
+
+# Short-TTL cache for the key JSON endpoints — dashboards poll these, and the
+# underlying list_keys/get_key_info walk every record + share row. Mutating
+# routes clear the cache so revocations are visible immediately.
+import time as _time
+
+_KEYS_TTL_S = 10.0
+_keys_cache: dict = {}  # cache key -> (monotonic ts, payload)
+
+
+def _keys_cache_get(key):
+    hit = _keys_cache.get(key)
+    if hit is not None and _time.monotonic() - hit[0] < _KEYS_TTL_S:
+        return hit[1]
+    return None
+
+
+def _keys_cache_put(key, payload):
+    _keys_cache[key] = (_time.monotonic(), payload)
+    return payload
+
 
 def admin_required(f):
     """Decorator to require admin role."""
@@ -41,8 +72,17 @@ def admin_required(f):
 @admin_required
 def key_management():
     """Key management dashboard."""
-    keys = list_keys()
-    return render_template("admin/keys.html", keys=keys)
+    # Paginate at the KeyRecord level, then format only the visible page —
+    # the records are already in hand, so format them directly instead of
+    # re-querying per row, and pull the share rows in one batched load.
+    page = request.args.get("page", 1, type=int)
+    records = (
+        KeyRecord.query.options(selectinload(KeyRecord.shares))
+        .order_by(KeyRecord.created_at.desc())
+        .paginate(page=page, per_page=50, error_out=False)
+    )
+    keys = [_key_info(r) for r in records.items]
+    return render_template("admin/keys.html", keys=keys, pagination=records)
 
 
 @admin_bp.route("/keys/<int:media_id>")
@@ -64,9 +104,9 @@ def key_detail(media_id):
 @admin_required
 def revoke_key_route(media_id):
     """Revoke a key (makes file undecryptable)."""
-    success = revoke_key(media_id)
-    
-    # Log the action
+    success = revoke_key(media_id, commit=False)
+
+    # Log the action — committed together with the revocation (one round-trip)
     log = AuditLog(
         user_id=current_user.id,
         action="key_revoke",
@@ -76,7 +116,8 @@ def revoke_key_route(media_id):
     )
     db.session.add(log)
     db.session.commit()
-    
+    _keys_cache.clear()
+
     if success:
         flash(f"Key for file #{media_id} has been revoked.", "success")
     else:
@@ -100,15 +141,16 @@ def split_key_route(media_id):
         return redirect(url_for("admin.key_detail", media_id=media_id))
     
     # Revoke old key record
-    revoke_key(media_id)
-    
+    revoke_key(media_id, commit=False)
+
     # Create new split key
     holder_ids_str = request.form.get("holder_ids", "")
     holder_ids = [int(x.strip()) for x in holder_ids_str.split(",") if x.strip()]
-    
-    store_key(media_id, key, n_shares=n_shares, threshold=threshold, holder_ids=holder_ids)
-    
-    # Log the action
+
+    store_key(media_id, key, n_shares=n_shares, threshold=threshold,
+              holder_ids=holder_ids, commit=False)
+
+    # Log the action — revoke + new shares + audit land in a single commit
     log = AuditLog(
         user_id=current_user.id,
         action="key_split",
@@ -118,7 +160,8 @@ def split_key_route(media_id):
     )
     db.session.add(log)
     db.session.commit()
-    
+    _keys_cache.clear()
+
     flash(f"Key split into {n_shares} shares (threshold: {threshold}).", "success")
     return redirect(url_for("admin.key_detail", media_id=media_id))
 
@@ -132,9 +175,15 @@ def split_key_route(media_id):
 @admin_required
 def policy_management():
     """Policy management dashboard."""
-    policies = Policy.query.order_by(Policy.created_at.desc()).all()
-    files = MediaFile.query.filter_by(status="encrypted").all()
-    users = User.query.all()
+    page = request.args.get("page", 1, type=int)
+    policies = Policy.query.order_by(Policy.created_at.desc()).paginate(
+        page=page, per_page=50, error_out=False
+    )
+    # Dropdown data: only id + label are rendered, so skip full-row hydration
+    files = MediaFile.query.filter_by(status="encrypted").with_entities(
+        MediaFile.id, MediaFile.original_filename
+    ).all()
+    users = User.query.with_entities(User.id, User.username, User.email).all()
     return render_template("admin/policies.html", policies=policies, files=files, users=users)
 
 
@@ -174,10 +223,11 @@ def create_policy_route():
         media_id=media_id if media_id else None,
         policy_type=PolicyType(policy_type),
         created_by=current_user.id,
+        commit=False,
         **kwargs
     )
-    
-    # Log the action
+
+    # Log the action — policy + audit row share one commit
     log = AuditLog(
         user_id=current_user.id,
         action="policy_create",
@@ -238,9 +288,9 @@ def share_file_route(media_id):
     expires_str = request.form.get("expires_at")
     expires_at = datetime.fromisoformat(expires_str) if expires_str else None
     
-    share_file(media_id, media.owner_id, user_ids, expires_at)
-    
-    # Log the action
+    share_file(media_id, media.owner_id, user_ids, expires_at, commit=False)
+
+    # Log the action — share policy + audit row share one commit
     log = AuditLog(
         user_id=current_user.id,
         action="file_share",
@@ -271,8 +321,12 @@ def audit_logs():
     )
     
     policy_logs = PolicyLog.query.order_by(PolicyLog.timestamp.desc()).limit(100).all()
-    
-    return render_template("admin/audit.html", logs=logs, policy_logs=policy_logs)
+
+    # Personalized but stable for a few seconds — spare re-renders on
+    # back/forward navigation and rapid refreshes
+    resp = make_response(render_template("admin/audit.html", logs=logs, policy_logs=policy_logs))
+    resp.headers["Cache-Control"] = "private, max-age=5"
+    return resp
 
 
 # ---------------------------------------------------------------------------
@@ -284,8 +338,18 @@ def audit_logs():
 @admin_required
 def user_management():
     """User management dashboard."""
-    users = User.query.order_by(User.created_at.desc()).all()
-    return render_template("admin/users.html", users=users)
+    page = request.args.get("page", 1, type=int)
+    users = User.query.order_by(User.created_at.desc()).paginate(
+        page=page, per_page=50, error_out=False
+    )
+    # Per-user file counts in one grouped query — the template used to run
+    # user.files.count() per row
+    file_counts = dict(db.session.execute(
+        db.select(MediaFile.owner_id, db.func.count(MediaFile.id))
+        .filter(MediaFile.owner_id.in_([u.id for u in users.items]))
+        .group_by(MediaFile.owner_id)
+    ).all())
+    return render_template("admin/users.html", users=users, file_counts=file_counts)
 
 
 @admin_bp.route("/users/<int:user_id>/toggle-admin", methods=["POST"])
@@ -316,33 +380,41 @@ def toggle_admin(user_id):
 # API Endpoints (JSON)
 # ---------------------------------------------------------------------------
 
-@admin_bp.route("/api/keys")
+@admin_api_bp.route("/keys")
 @login_required
 @admin_required
-@csrf.exempt
 def api_list_keys():
     """API: List all keys."""
     status = request.args.get("status")
-    keys = list_keys(status=status)
-    return jsonify(keys)
+    keys = _keys_cache_get(("list", status))
+    if keys is None:
+        keys = _keys_cache_put(("list", status), list_keys(status=status))
+    # ETag lets polling dashboards get a body-less 304 when nothing changed
+    resp = jsonify(keys)
+    resp.set_etag(hashlib.md5(repr(keys).encode()).hexdigest())
+    return resp.make_conditional(request)
 
 
-@admin_bp.route("/api/keys/<int:media_id>")
+@admin_api_bp.route("/keys/<int:media_id>")
 @login_required
 @admin_required
-@csrf.exempt
 def api_key_detail(media_id):
     """API: Get key details."""
-    key_info = get_key_info(media_id)
+    key_info = _keys_cache_get(("detail", media_id))
+    if key_info is None:
+        key_info = get_key_info(media_id)
+        if key_info is not None:
+            _keys_cache_put(("detail", media_id), key_info)
     if not key_info:
         return jsonify({"error": "Key not found"}), 404
-    return jsonify(key_info)
+    resp = jsonify(key_info)
+    resp.set_etag(hashlib.md5(repr(key_info).encode()).hexdigest())
+    return resp.make_conditional(request)
 
 
-@admin_bp.route("/api/check-access", methods=["POST"])
+@admin_api_bp.route("/check-access", methods=["POST"])
 @login_required
 @admin_required
-@csrf.exempt
 def api_check_access():
     """API: Check if a user has access to a file."""
     data = request.get_json()
@@ -370,7 +442,13 @@ def share_audit():
     page = request.args.get("page", 1, type=int)
     status_filter = request.args.get("status", "")
 
-    query = ShareToken.query.order_by(ShareToken.created_at.desc())
+    # Eager-load media/sender/recipient — the template reads all three per
+    # token, which otherwise fires three lazy SELECTs per row (N+1).
+    query = ShareToken.query.options(
+        selectinload(ShareToken.media),
+        selectinload(ShareToken.sender),
+        selectinload(ShareToken.recipient),
+    ).order_by(ShareToken.created_at.desc())
     if status_filter:
         query = query.filter_by(status=status_filter)
 
@@ -434,7 +512,7 @@ def admin_revoke_all_tokens(media_id: int):
     ).all()
 
     for t in tokens:
-        t.revoke()
+        t.revoke(commit=False)
 
     db.session.add(AuditLog(
         user_id=current_user.id, action="share_admin_revoke_all",
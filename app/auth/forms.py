@@ -6,8 +6,23 @@ from flask_wtf import FlaskForm
 from wtforms import StringField, PasswordField, BooleanField, SubmitField
 from wtforms.validators import DataRequired, EqualTo, Length, ValidationError
 
+from app import db
 from app.models import User
 
+# Compiled once at import — re.match's internal cache is bounded and this
+# pattern is hit on every login/registration submit.
+_EMAIL_RE = re.compile(r"^[^@\s]+@[^@\s]+\.[^@\s]+$")
+
+
+def _check_email_format(email_value: str) -> None:
+    """Raise ValidationError unless *email_value* looks like an email.
+
+    The literal "admin" is allowed (the built-in admin account logs in
+    without a real address).
+    """
+    if email_value != "admin" and not _EMAIL_RE.match(email_value):
+        raise ValidationError("Invalid email address.")
+
 
 class RegistrationForm(FlaskForm):
     username = StringField(
@@ -23,16 +38,20 @@ class RegistrationForm(FlaskForm):
     submit = SubmitField("Register")
 
     def validate_username(self, field):
-        if User.query.filter_by(username=field.data.strip()).first():
+        # SELECT EXISTS(...) — stops at the first hit on the unique index
+        taken = db.session.query(
+            User.query.filter_by(username=field.data.strip()).exists()
+        ).scalar()
+        if taken:
             raise ValidationError("Username already taken.")
 
     def validate_email(self, field):
         email_value = field.data.strip().lower()
-        if email_value != "admin":
-            email_regex = r"^[^@\s]+@[^@\s]+\.[^@\s]+$"
-            if not re.match(email_regex, email_value):
-                raise ValidationError("Invalid email address.")
-        if User.query.filter_by(email=email_value).first():
+        _check_email_format(email_value)
+        registered = db.session.query(
+            User.query.filter_by(email=email_value).exists()
+        ).scalar()
+        if registered:
             raise ValidationError("Email already registered.")
 
 
@@ -43,8 +62,4 @@ class LoginForm(FlaskForm):
     submit = SubmitField("Log In")
 
     def validate_email(self, field):
-        email_value = field.data.strip().lower()
-        if email_value != "admin":
-            email_regex = r"^[^@\s]+@[^@\s]+\.[^@\s]+$"
-            if not re.match(email_regex, email_value):
-                raise ValidationError("Invalid email address.")
+        _check_email_format(field.data.strip().lower())
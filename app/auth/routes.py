@@ -1,14 +1,60 @@
 """Auth blueprint – register, login, logout."""
 
+import time
+
 from flask import Blueprint, render_template, redirect, url_for, flash, request
 from flask_login import login_user, logout_user, login_required, current_user
+from argon2.exceptions import InvalidHashError, VerificationError
 
 from app import db
-from app.models import User, AuditLog
+from app.models import User, AuditLog, password_hasher
 from app.auth.forms import RegistrationForm, LoginForm
 
 auth_bp = Blueprint("auth", __name__, url_prefix="/auth")
 
+# Checked when the email matches no account, so unknown and known users cost
+# the same hash time (no user-enumeration via response timing).
+_DUMMY_HASH = password_hasher.hash("not-a-real-password")
+
+# Failed-login throttle. Password hashing is CPU-bound and stalls a worker
+# per attempt; after _FAILED_MAX failures in the window we refuse before
+# touching the hash at all. Buckets are keyed on (client IP, email) — behind
+# the shipped nginx proxy many clients can present the same address (wsgi.py
+# installs ProxyFix for the one trusted hop), and a bare-IP bucket would let
+# one noisy client lock the form for everyone sharing it.
+_FAILED_MAX = 10
+_FAILED_WINDOW_S = 300.0
+_FAILED_ENTRIES_MAX = 10_000
+_failed_logins: dict = {}  # (ip, email) -> [count, window start (monotonic)]
+
+
+def _login_throttled(key: tuple) -> bool:
+    entry = _failed_logins.get(key)
+    if not entry:
+        return False
+    count, started = entry
+    if time.monotonic() - started > _FAILED_WINDOW_S:
+        del _failed_logins[key]
+        return False
+    return count >= _FAILED_MAX
+
+
+def _record_failed_login(key: tuple) -> None:
+    entry = _failed_logins.get(key)
+    now = time.monotonic()
+    if entry is None or now - entry[1] > _FAILED_WINDOW_S:
+        if len(_failed_logins) >= _FAILED_ENTRIES_MAX:
+            # Drop expired windows first; clear outright if still full so
+            # the table stays bounded no matter how many keys attackers burn
+            for k in [k for k, v in _failed_logins.items()
+                      if now - v[1] > _FAILED_WINDOW_S]:
+                del _failed_logins[k]
+            if len(_failed_logins) >= _FAILED_ENTRIES_MAX:
+                _failed_logins.clear()
+        _failed_logins[key] = [1, now]
+    else:
+        entry[0] += 1
+
 
 @auth_bp.route("/register", methods=["GET", "POST"])
 def register():
@@ -43,8 +89,15 @@ def login():
 
     form = LoginForm()
     if form.validate_on_submit():
-        user = User.query.filter_by(email=form.email.data.strip().lower()).first()
+        email = form.email.data.strip().lower()
+        throttle_key = (request.remote_addr or "?", email)
+        if _login_throttled(throttle_key):
+            flash("Too many failed login attempts. Please try again later.", "danger")
+            return render_template("auth/login.html", form=form), 429
+
+        user = User.query.filter_by(email=email).first()
         if user and user.check_password(form.password.data):
+            _failed_logins.pop(throttle_key, None)
             login_user(user, remember=form.remember.data)
             db.session.add(AuditLog(user_id=user.id, action="login", result="success"))
             db.session.commit()
@@ -55,6 +108,13 @@ def login():
         if user:
             db.session.add(AuditLog(user_id=user.id, action="login", result="failure"))
             db.session.commit()
+        else:
+            # Burn the same hash time for unknown accounts
+            try:
+                password_hasher.verify(_DUMMY_HASH, form.password.data)
+            except (VerificationError, InvalidHashError):
+                pass
+        _record_failed_login(throttle_key)
         flash("Invalid email or password.", "danger")
 
     return render_template("auth/login.html", form=form)
@@ -10,22 +10,83 @@ Flow:
 
 import os
 import base64
+import hashlib
+import logging
+import mmap
 import time
+from functools import lru_cache
 from typing import Tuple
 
-from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.backends.openssl import backend as _openssl_backend
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM, AESGCMSIV
 from cryptography.fernet import Fernet
 
+# All Cipher/update_into calls below go through OpenSSL's EVP interface,
+# which auto-dispatches AES-NI (x86_64) / ARMv8 Crypto Extensions. Logged
+# once at import so deployments can confirm which OpenSSL is in play.
+logging.getLogger(__name__).debug(
+    "AES backend: %s", _openssl_backend.openssl_version_text()
+)
+
+# Streaming parameters — bound memory regardless of media size.
+_CHUNK_SIZE = 1024 * 1024  # 1 MiB per read
+_NONCE_SIZE = 12
+_TAG_SIZE = 16
+
+
+@lru_cache(maxsize=64)
+def _aes_algorithm(key: bytes) -> algorithms.AES:
+    """Cached per-key AES algorithm object.
+
+    Each AES instantiation re-schedules the round keys; hot keys (repeat
+    downloads, per-chunk streaming) reuse the same object. Only the keyed
+    algorithm is cached — GCM mode state is nonce-specific and always fresh.
+    """
+    return algorithms.AES(key)
+
+
+def _advise_sequential(fd: int) -> None:
+    """Hint the kernel that *fd* will be read/written sequentially (POSIX only)."""
+    if hasattr(os, "posix_fadvise"):
+        try:
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_SEQUENTIAL)
+        except OSError:
+            pass  # e.g. pipes / non-seekable fds
+
 # ---------------------------------------------------------------------------
-# Master Fernet key — in production this MUST come from env / vault.
+# Master key — in production this MUST come from env / vault. Resolved
+# lazily so importing the module (CLI startup, worker fork, scripts that
+# never touch keys) does no entropy read or cipher construction.
 # ---------------------------------------------------------------------------
-_MASTER_KEY = os.environ.get("FERNET_MASTER_KEY")
-if _MASTER_KEY is None:
-    # Auto-generate for dev (printed once so the developer can persist it)
-    _MASTER_KEY = Fernet.generate_key().decode()
-    print(f"[DEV] Generated FERNET_MASTER_KEY={_MASTER_KEY}")
 
-_fernet = Fernet(_MASTER_KEY.encode() if isinstance(_MASTER_KEY, str) else _MASTER_KEY)
+@lru_cache(maxsize=1)
+def _master_key() -> str:
+    key = os.environ.get("FERNET_MASTER_KEY")
+    if key is None:
+        # Dev fallback: generate once and publish via the environment so
+        # every module in this process derives the same master key
+        key = Fernet.generate_key().decode()
+        os.environ["FERNET_MASTER_KEY"] = key
+    return key
+
+
+@lru_cache(maxsize=1)
+def _get_fernet() -> Fernet:
+    """Fernet instance for legacy tokens already stored in the DB."""
+    return Fernet(_master_key().encode())
+
+
+@lru_cache(maxsize=1)
+def _get_siv() -> AESGCMSIV:
+    """AES-256-GCM-SIV wrapper keyed by the same master key material (a
+    Fernet key decodes to exactly 32 random bytes). One AES-NI/PCLMULQDQ
+    pass instead of Fernet's AES-128-CBC + HMAC-SHA256 + timestamp framing."""
+    return AESGCMSIV(base64.urlsafe_b64decode(_master_key()))
+
+# Version prefix for GCM-SIV tokens; anything without it is a legacy Fernet
+# token and takes the fallback decrypt path.
+_KW_PREFIX = "kw1:"
 
 
 # ---------------------------------------------------------------------------
@@ -38,13 +99,44 @@ def generate_file_key() -> bytes:
 
 
 def wrap_key(file_key: bytes) -> str:
-    """Fernet-encrypt the file key and return a URL-safe string for DB storage."""
-    return _fernet.encrypt(file_key).decode()
+    """Wrap the file key with AES-256-GCM-SIV for DB storage.
+
+    Token layout is ``kw1:`` + base64(nonce || ciphertext || tag) — a much
+    shorter token than Fernet's and a single hardware-accelerated pass.
+    The random nonce keeps wrapping nondeterministic (and GCM-SIV is
+    nonce-misuse resistant besides).
+    """
+    nonce = os.urandom(_NONCE_SIZE)
+    blob = nonce + _get_siv().encrypt(nonce, file_key, None)
+    return _KW_PREFIX + base64.b64encode(blob).decode()
+
+
+# Short-TTL unwrap cache: read-heavy views (dashboard, repeat downloads)
+# unwrap the same token over and over; the TTL keeps revocation honest.
+_UNWRAP_TTL_S = 60.0
+_UNWRAP_CACHE_MAX = 256
+_unwrap_cache: dict = {}  # wrapped token -> (monotonic ts, raw key)
 
 
 def unwrap_key(wrapped: str) -> bytes:
-    """Recover the raw AES key from its Fernet token."""
-    return _fernet.decrypt(wrapped.encode())
+    """Recover the raw AES key from its wrapped token (cached for 60 s).
+
+    Accepts both GCM-SIV tokens (``kw1:`` prefix) and legacy Fernet tokens
+    already stored in the DB.
+    """
+    now = time.monotonic()
+    hit = _unwrap_cache.get(wrapped)
+    if hit is not None and now - hit[0] < _UNWRAP_TTL_S:
+        return hit[1]
+    if wrapped.startswith(_KW_PREFIX):
+        blob = base64.b64decode(wrapped[len(_KW_PREFIX):])
+        raw = _get_siv().decrypt(blob[:_NONCE_SIZE], blob[_NONCE_SIZE:], None)
+    else:
+        raw = _get_fernet().decrypt(wrapped.encode())
+    if len(_unwrap_cache) >= _UNWRAP_CACHE_MAX:
+        _unwrap_cache.clear()
+    _unwrap_cache[wrapped] = (now, raw)
+    return raw
 
 
 # ---------------------------------------------------------------------------
@@ -54,48 +146,136 @@ def unwrap_key(wrapped: str) -> bytes:
 def encrypt_bytes(plaintext: bytes, key: bytes) -> bytes:
     """Encrypt *plaintext* with AES-256-GCM.
 
-    Returns ``nonce (12 B) || ciphertext+tag``.
+    Uses the streaming Cipher API (update_into over a preallocated buffer)
+    rather than the one-shot AESGCM helper — same AES-NI/PCLMULQDQ codepath
+    in OpenSSL, but no second full-size intermediate allocation.
+
+    Returns ``nonce (12 B) || ciphertext || tag (16 B)`` — byte-identical
+    layout to what AESGCM.encrypt produced, so old blobs still decrypt.
     """
-    nonce = os.urandom(12)
-    aesgcm = AESGCM(key)
-    ct = aesgcm.encrypt(nonce, plaintext, associated_data=None)
-    return nonce + ct
+    nonce = os.urandom(_NONCE_SIZE)
+    encryptor = Cipher(_aes_algorithm(key), modes.GCM(nonce)).encryptor()
+    out = bytearray(_NONCE_SIZE + len(plaintext) + _TAG_SIZE)
+    out[:_NONCE_SIZE] = nonce
+    view = memoryview(out)
+    pos = _NONCE_SIZE
+    for off in range(0, len(plaintext), _CHUNK_SIZE):
+        chunk = memoryview(plaintext)[off:off + _CHUNK_SIZE]
+        pos += encryptor.update_into(chunk, view[pos:pos + len(chunk) + 16])
+    encryptor.finalize()
+    out[pos:] = encryptor.tag
+    return bytes(out)
 
 
 def decrypt_bytes(blob: bytes, key: bytes) -> bytes:
-    """Decrypt a blob produced by *encrypt_bytes*."""
-    nonce, ct = blob[:12], blob[12:]
-    aesgcm = AESGCM(key)
-    return aesgcm.decrypt(nonce, ct, associated_data=None)
+    """Decrypt a blob produced by *encrypt_bytes*.
+
+    Raises if the blob is too short or its GCM tag does not verify.
+    """
+    if len(blob) < _NONCE_SIZE + _TAG_SIZE:
+        raise ValueError("Encrypted blob too short — missing nonce/tag")
+    # bytes() here keeps bytearray/memoryview inputs working (GCM wants bytes)
+    nonce, tag = bytes(blob[:_NONCE_SIZE]), bytes(blob[-_TAG_SIZE:])
+    body = memoryview(blob)[_NONCE_SIZE:-_TAG_SIZE]
+    decryptor = Cipher(_aes_algorithm(key), modes.GCM(nonce, tag)).decryptor()
+    # +16 headroom: update_into needs len(data) + block_size - 1 spare bytes
+    out = bytearray(len(body) + 16)
+    view = memoryview(out)
+    pos = 0
+    for off in range(0, len(body), _CHUNK_SIZE):
+        chunk = body[off:off + _CHUNK_SIZE]
+        pos += decryptor.update_into(chunk, view[pos:])
+    decryptor.finalize()  # InvalidTag on tamper
+    return bytes(view[:pos])
 
 
 # ---------------------------------------------------------------------------
 # High-level file helpers (used by the media blueprint)
 # ---------------------------------------------------------------------------
 
-def encrypt_file(src_path: str, dst_path: str) -> Tuple[str, dict]:
-    """Read *src_path*, encrypt, write to *dst_path*.
+def encrypt_file(src, dst_path: str) -> Tuple[str, dict]:
+    """Encrypt *src* — a filesystem path or a binary file-like object —
+    and write to *dst_path*.
+
+    Accepting a file-like lets callers pipe an upload stream straight into
+    encryption without materialising a plaintext temp file first. Streams
+    through AES-GCM in 1 MiB chunks so memory stays bounded for multi-GB
+    media. Output layout matches *encrypt_bytes*:
+    ``nonce (12 B) || ciphertext || tag (16 B)``.
+
+    The ciphertext is fingerprinted while it is written — SHA-256 over the
+    whole output plus the first KiB as a sample — so verification never has
+    to re-read the stored file (``cipher_sha256`` / ``cipher_sample`` in
+    the returned metadata).
 
     Returns:
         (wrapped_key, metadata_dict)
     """
     t0 = time.perf_counter()
-    with open(src_path, "rb") as f:
-        plaintext = f.read()
-
     file_key = generate_file_key()
-    ciphertext = encrypt_bytes(plaintext, file_key)
-
-    with open(dst_path, "wb") as f:
-        f.write(ciphertext)
+    nonce = os.urandom(_NONCE_SIZE)
+    encryptor = Cipher(_aes_algorithm(file_key), modes.GCM(nonce)).encryptor()
+
+    # update_into needs len(data) + block_size - 1 bytes of headroom
+    out_buf = bytearray(_CHUNK_SIZE + 16)
+    out_view = memoryview(out_buf)
+    original_size = 0
+    sha = hashlib.sha256()
+    sample = bytearray()  # first KiB of output, for the entropy check
+
+    from_path = isinstance(src, (str, bytes, os.PathLike))
+    fin = open(src, "rb") if from_path else src
+    try:
+        with open(dst_path, "wb") as fout:
+            _advise_sequential(fout.fileno())
+            fout.write(nonce)
+            sha.update(nonce)
+            sample += nonce
+            src_size = -1
+            if from_path:
+                _advise_sequential(fin.fileno())
+                src_size = os.fstat(fin.fileno()).st_size
+            if from_path and os.name == "posix" and src_size > 0:
+                # Zero-copy read path: AES-NI consumes pages straight from
+                # the page cache instead of a userspace copy per chunk.
+                with mmap.mmap(fin.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    for off in range(0, src_size, _CHUNK_SIZE):
+                        window = memoryview(mm)[off:off + _CHUNK_SIZE]
+                        written = encryptor.update_into(window, out_buf)
+                        window.release()
+                        fout.write(out_view[:written])
+                        sha.update(out_view[:written])
+                        if len(sample) < 1024:
+                            sample += out_view[:min(written, 1024 - len(sample))]
+                original_size = src_size
+            else:
+                # Chunked read (file-like sources, Windows, or empty file)
+                while True:
+                    chunk = fin.read(_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    written = encryptor.update_into(chunk, out_buf)
+                    fout.write(out_view[:written])
+                    sha.update(out_view[:written])
+                    if len(sample) < 1024:
+                        sample += out_view[:min(written, 1024 - len(sample))]
+                    original_size += len(chunk)
+            encryptor.finalize()
+            fout.write(encryptor.tag)
+            sha.update(encryptor.tag)
+    finally:
+        if from_path:
+            fin.close()
 
     wrapped = wrap_key(file_key)
     elapsed = time.perf_counter() - t0
 
     meta = {
-        "original_size": len(plaintext),
-        "encrypted_size": len(ciphertext),
+        "original_size": original_size,
+        "encrypted_size": original_size + _NONCE_SIZE + _TAG_SIZE,
         "encryption_time_s": round(elapsed, 4),
+        "cipher_sha256": sha.hexdigest(),
+        "cipher_sample": bytes(sample[:1024]),
     }
     return wrapped, meta
 
@@ -103,21 +283,85 @@ def encrypt_file(src_path: str, dst_path: str) -> Tuple[str, dict]:
 def decrypt_file(src_path: str, dst_path: str, wrapped_key: str) -> dict:
     """Read encrypted *src_path*, decrypt, write to *dst_path*.
 
+    Mirrors *encrypt_file*: reads the 12-byte nonce and trailing 16-byte tag,
+    then streams the ciphertext body through AES-GCM in 1 MiB chunks. The tag
+    is verified on finalize — a corrupted file raises before this returns.
+
     Returns metadata dict.
     """
     t0 = time.perf_counter()
     file_key = unwrap_key(wrapped_key)
 
-    with open(src_path, "rb") as f:
-        blob = f.read()
-
-    plaintext = decrypt_bytes(blob, file_key)
-
-    with open(dst_path, "wb") as f:
-        f.write(plaintext)
+    total_size = os.path.getsize(src_path)
+    body_size = total_size - _NONCE_SIZE - _TAG_SIZE
+    if body_size < 0:
+        raise ValueError("Encrypted file too short — missing nonce/tag")
+
+    out_buf = bytearray(_CHUNK_SIZE + 16)
+    out_view = memoryview(out_buf)
+    decrypted_size = 0
+
+    with open(src_path, "rb") as fin, open(dst_path, "wb") as fout:
+        nonce = fin.read(_NONCE_SIZE)
+        fin.seek(total_size - _TAG_SIZE)
+        tag = fin.read(_TAG_SIZE)
+        fin.seek(_NONCE_SIZE)
+
+        decryptor = Cipher(_aes_algorithm(file_key), modes.GCM(nonce, tag)).decryptor()
+        remaining = body_size
+        while remaining > 0:
+            chunk = fin.read(min(_CHUNK_SIZE, remaining))
+            if not chunk:
+                raise ValueError("Encrypted file truncated mid-body")
+            written = decryptor.update_into(chunk, out_buf)
+            fout.write(out_view[:written])
+            decrypted_size += len(chunk)
+            remaining -= len(chunk)
+        decryptor.finalize()  # raises InvalidTag if the file was tampered with
 
     elapsed = time.perf_counter() - t0
     return {
-        "decrypted_size": len(plaintext),
+        "decrypted_size": decrypted_size,
         "decryption_time_s": round(elapsed, 4),
     }
+
+
+def decrypt_file_stream(src_path: str, wrapped_key: str):
+    """Yield decrypted chunks of *src_path* without a plaintext temp file.
+
+    Generator variant of *decrypt_file* for streaming HTTP responses: the
+    first bytes reach the client after one chunk instead of after the whole
+    file has been decrypted to disk. The GCM tag is verified before the
+    final chunk is yielded, so a tampered file raises InvalidTag rather
+    than completing the download.
+    """
+    file_key = unwrap_key(wrapped_key)
+
+    total_size = os.path.getsize(src_path)
+    body_size = total_size - _NONCE_SIZE - _TAG_SIZE
+    if body_size < 0:
+        raise ValueError("Encrypted file too short — missing nonce/tag")
+
+    out_buf = bytearray(_CHUNK_SIZE + 16)
+    out_view = memoryview(out_buf)
+
+    with open(src_path, "rb") as fin:
+        _advise_sequential(fin.fileno())
+        nonce = fin.read(_NONCE_SIZE)
+        fin.seek(total_size - _TAG_SIZE)
+        tag = fin.read(_TAG_SIZE)
+        fin.seek(_NONCE_SIZE)
+
+        decryptor = Cipher(_aes_algorithm(file_key), modes.GCM(nonce, tag)).decryptor()
+        remaining = body_size
+        while remaining > 0:
+            chunk = fin.read(min(_CHUNK_SIZE, remaining))
+            if not chunk:
+                raise ValueError("Encrypted file truncated mid-body")
+            remaining -= len(chunk)
+            written = decryptor.update_into(chunk, out_buf)
+            if remaining == 0:
+                decryptor.finalize()  # verify before releasing the last chunk
+            yield bytes(out_view[:written])
+        if body_size == 0:
+            decryptor.finalize()
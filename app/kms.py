@@ -15,83 +15,136 @@ Dependencies: cryptography, secrets
 import os
 import secrets
 import hashlib
+import time
+from functools import lru_cache
 from typing import Tuple, List, Optional
 from datetime import datetime, timezone
 
+import base64
+from enum import Enum
+
 from cryptography.hazmat.primitives.ciphers.aead import AESGCM
-from cryptography.fernet import Fernet
+from sqlalchemy.orm import selectinload
 
 from app import db
 
 
 # ---------------------------------------------------------------------------
-# Master Fernet key — in production this MUST come from env / vault.
+# Master key — in production this MUST come from env / vault. Resolved
+# lazily through app.encryption's cached singletons, so importing this
+# module does no entropy read or cipher construction, and both modules
+# always derive from the same key material.
 # ---------------------------------------------------------------------------
-_MASTER_KEY = os.environ.get("FERNET_MASTER_KEY")
-if _MASTER_KEY is None:
-    _MASTER_KEY = Fernet.generate_key().decode()
-    print(f"[DEV] Generated FERNET_MASTER_KEY={_MASTER_KEY}")
+from app.encryption import _get_fernet, _get_siv
 
-_fernet = Fernet(_MASTER_KEY.encode() if isinstance(_MASTER_KEY, str) else _MASTER_KEY)
+_KW_PREFIX = b"kw1:"
+_NONCE_SIZE = 12
 
 
 # ---------------------------------------------------------------------------
 # Shamir's Secret Sharing Implementation
 # ---------------------------------------------------------------------------
-# Using GF(257) with base64 encoding for shares since values can be 0-256
-
-import base64
-
-_PRIME = 257  # Smallest prime > 256 for GF operations
-
-
-def _mod_inverse(a: int, p: int = _PRIME) -> int:
-    """Compute modular inverse using extended Euclidean algorithm."""
+# Arithmetic is over GF(2^8) (AES polynomial 0x11b), the field used by
+# Reed-Solomon and most production Shamir implementations. Every field
+# element is exactly one byte, so shares are the same length as the secret,
+# and multiply/inverse are O(1) log/antilog table lookups — no modular
+# inverse loop in the Lagrange kernel.
+
+# Log/antilog tables built once at import by iterating generator 0x03.
+# _GF_EXP is doubled so gf_mul can index LOG[a]+LOG[b] without a mod 255.
+_GF_EXP = [0] * 512
+_GF_LOG = [0] * 256
+_x = 1
+for _i in range(255):
+    _GF_EXP[_i] = _x
+    _GF_LOG[_x] = _i
+    _xt = _x << 1  # multiply by generator 0x03 = xtime(x) ^ x
+    if _xt & 0x100:
+        _xt ^= 0x11B
+    _x = _xt ^ _x
+for _i in range(255, 512):
+    _GF_EXP[_i] = _GF_EXP[_i - 255]
+del _x, _xt, _i
+
+
+# Full 256x256 product table (64 KiB). Scalar multiplies collapse to one
+# indexed load with no zero-branch — the table-lookup kernel a C extension
+# would use, kept in pure Python since this tree has no native build step.
+_GF_MUL = [
+    bytes(_GF_EXP[_GF_LOG[a] + _GF_LOG[b]] if a and b else 0 for b in range(256))
+    for a in range(256)
+]
+
+
+def _gf_mul(a: int, b: int) -> int:
+    """Multiply two GF(2^8) elements via the product table."""
+    return _GF_MUL[a][b]
+
+
+def _gf_inv(a: int) -> int:
+    """Multiplicative inverse in GF(2^8)."""
     if a == 0:
         raise ValueError("Cannot compute inverse of 0")
-    lm, hm = 1, 0
-    low, high = a % p, p
-    while low > 1:
-        ratio = high // low
-        nm, new = hm - lm * ratio, high - low * ratio
-        lm, low, hm, high = nm, new, lm, low
-    return lm % p
+    return _GF_EXP[255 - _GF_LOG[a]]
 
 
-def _eval_poly(coeffs: List[int], x: int, prime: int = _PRIME) -> int:
-    """Evaluate polynomial at x in GF(prime)."""
+def _eval_poly(coeffs: List[int], x: int) -> int:
+    """Evaluate polynomial at x in GF(2^8) (Horner's method)."""
     result = 0
     for coeff in reversed(coeffs):
-        result = (result * x + coeff) % prime
+        result = _gf_mul(result, x) ^ coeff
     return result
 
 
-def _encode_share(values: List[int]) -> bytes:
-    """Encode share values (0-256) to bytes using 2 bytes per value."""
-    # Use big-endian 2-byte encoding for each value
-    encoded = bytearray()
-    for v in values:
-        encoded.extend(v.to_bytes(2, 'big'))
-    return bytes(encoded)
+@lru_cache(maxsize=1)
+def _np_gf():
+    """NumPy view of the GF(2^8) tables (imported lazily — keeps worker
+    cold-start free of the numpy import unless Shamir is actually used)."""
+    import numpy as np
+    return np, np.array(_GF_LOG, dtype=np.int32), np.array(_GF_EXP, dtype=np.uint8)
+
 
+def _gf_mul_vec(a, b, np, LOG, EXP):
+    """Element-wise GF(2^8) multiply over ndarrays via table lookups."""
+    out = EXP[LOG[a] + LOG[b]]
+    return np.where((a == 0) | (b == 0), 0, out)
 
-def _decode_share(data: bytes) -> List[int]:
-    """Decode share bytes back to values (0-256)."""
-    values = []
-    for i in range(0, len(data), 2):
-        values.append(int.from_bytes(data[i:i+2], 'big'))
-    return values
+
+@lru_cache(maxsize=4096)
+def _lagrange_basis(x_coords: Tuple[int, ...]) -> Tuple[int, ...]:
+    """Lagrange basis weights L_i(0) for the given share x-coordinates.
+
+    In GF(2^8) addition is XOR and negation is identity, so
+    L_i(0) = prod_{j!=i} x_j / (x_i ^ x_j).
+
+    Deployments use a small set of (n, k) configurations, so the possible
+    x-coordinate subsets repeat constantly — memoized, reconstruction does
+    zero basis work after the first sight of a subset (a few bytes each).
+    """
+    basis = []
+    for i, xi in enumerate(x_coords):
+        num = 1
+        den = 1
+        for j, xj in enumerate(x_coords):
+            if i != j:
+                num = _gf_mul(num, xj)
+                den = _gf_mul(den, xi ^ xj)
+        basis.append(_gf_mul(num, _gf_inv(den)))
+    return tuple(basis)
 
 
 def split_secret(secret: bytes, n: int, k: int) -> List[Tuple[int, bytes]]:
     """
     Split a secret into n shares, requiring k shares to reconstruct.
-    
+
+    Each share is the same length as the secret (one GF(2^8) element per
+    secret byte).
+
     Args:
         secret: The secret bytes to split
         n: Total number of shares to generate
         k: Threshold - minimum shares needed to reconstruct
-        
+
     Returns:
         List of (share_index, share_bytes) tuples
     """
@@ -101,74 +154,81 @@ def split_secret(secret: bytes, n: int, k: int) -> List[Tuple[int, bytes]]:
         raise ValueError("Threshold k must be at least 2")
     if n > 255:
         raise ValueError("Maximum 255 shares supported")
-    
-    shares = [[] for _ in range(n)]
-    
-    for byte in secret:
-        # Generate random polynomial coefficients (degree k-1)
-        # The constant term is the secret byte
-        coeffs = [byte] + [secrets.randbelow(_PRIME) for _ in range(k - 1)]
-        
-        # Evaluate polynomial at points 1, 2, ..., n
-        for i in range(n):
-            x = i + 1  # x values are 1-indexed
-            y = _eval_poly(coeffs, x)
-            shares[i].append(y)
-    
-    # Encode shares (values can be 0-256, so use 2 bytes per value)
-    return [(i + 1, _encode_share(share)) for i, share in enumerate(shares)]
+
+    np, LOG, EXP = _np_gf()
+    L = len(secret)
+
+    # One polynomial per secret byte, evaluated at every x in 1..n at once.
+    # Column 0 is the constant term (the secret); the rest is one bulk CSPRNG
+    # draw instead of L*(k-1) randbelow calls.
+    coeffs = np.empty((L, k), dtype=np.uint8)
+    coeffs[:, 0] = np.frombuffer(secret, dtype=np.uint8)
+    if k > 1 and L:
+        coeffs[:, 1:] = np.frombuffer(
+            secrets.token_bytes(L * (k - 1)), dtype=np.uint8
+        ).reshape(L, k - 1)
+
+    xs = np.arange(1, n + 1, dtype=np.uint8).reshape(n, 1)
+    # Horner across all n share polynomials simultaneously: acc is (n, L).
+    # log(x) is invariant across iterations, and the per-step multiply runs
+    # in-place through preallocated buffers — no fresh (n, L) temporaries
+    # per Horner pass.
+    log_xs = LOG[xs]
+    acc = np.broadcast_to(coeffs[:, k - 1], (n, L)).copy()
+    logsum = np.empty((n, L), dtype=np.int32)
+    for j in range(k - 2, -1, -1):
+        zero = acc == 0  # x is never 0, so only acc can zero a product
+        np.add(LOG[acc], log_xs, out=logsum)
+        np.take(EXP, logsum, out=acc)
+        acc[zero] = 0
+        acc ^= coeffs[:, j]
+
+    return [(i + 1, acc[i].tobytes()) for i in range(n)]
 
 
 def reconstruct_secret(shares: List[Tuple[int, bytes]], secret_length: int) -> bytes:
     """
     Reconstruct the secret from k or more shares using Lagrange interpolation.
-    
+
     Args:
         shares: List of (share_index, share_bytes) tuples
         secret_length: Expected length of the original secret
-        
+
     Returns:
         The reconstructed secret bytes
     """
     if len(shares) < 2:
         raise ValueError("Need at least 2 shares to reconstruct")
-    
-    # Decode shares from bytes to integer lists
-    decoded_shares = [(idx, _decode_share(data)) for idx, data in shares]
-    
+
     # Verify all shares have the same length
-    share_len = len(decoded_shares[0][1])
-    if not all(len(s[1]) == share_len for s in decoded_shares):
+    share_len = len(shares[0][1])
+    if not all(len(s[1]) == share_len for s in shares):
         raise ValueError("All shares must have the same length")
-    
-    x_coords = [s[0] for s in decoded_shares]
-    result = []
-    
-    for byte_idx in range(share_len):
-        y_coords = [s[1][byte_idx] for s in decoded_shares]
-        
-        # Lagrange interpolation to find f(0)
-        secret_byte = 0
-        for i, (xi, yi) in enumerate(zip(x_coords, y_coords)):
-            # Compute Lagrange basis polynomial L_i(0)
-            num = 1
-            den = 1
-            for j, xj in enumerate(x_coords):
-                if i != j:
-                    num = (num * (-xj)) % _PRIME
-                    den = (den * (xi - xj)) % _PRIME
-            
-            lagrange = (num * _mod_inverse(den)) % _PRIME
-            secret_byte = (secret_byte + yi * lagrange) % _PRIME
-        
-        result.append(secret_byte)
-    
-    return bytes(result[:secret_length])
+
+    # The basis depends only on the share x-coordinates, not on the secret
+    # bytes — compute it once, then apply as one weighted XOR-sum per share.
+    basis = _lagrange_basis(tuple(s[0] for s in shares))
+
+    np, LOG, EXP = _np_gf()
+    result = np.zeros(share_len, dtype=np.uint8)
+    for (_, data), lagrange in zip(shares, basis):
+        yi = np.frombuffer(data, dtype=np.uint8)
+        result ^= _gf_mul_vec(yi, np.uint8(lagrange), np, LOG, EXP)
+
+    return result[:secret_length].tobytes()
 
 
 # ---------------------------------------------------------------------------
 # Key Record Model
 # ---------------------------------------------------------------------------
+class KeyStatus(str, Enum):
+    """Lifecycle states for key records and shares (same shape as PolicyType)."""
+    ACTIVE = "active"
+    USED = "used"
+    REVOKED = "revoked"
+    ROTATED = "rotated"
+
+
 class KeyRecord(db.Model):
     """Stores encryption keys and their shares for a media file."""
     __tablename__ = "key_records"
@@ -176,23 +236,30 @@ class KeyRecord(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     media_id = db.Column(db.Integer, db.ForeignKey("media_files.id"), nullable=False, unique=True)
     
-    # Encrypted key (Fernet-wrapped) - used when no splitting required
-    encrypted_key = db.Column(db.Text, nullable=True)
+    # Encrypted key (Fernet-wrapped, raw token bytes) - used when no
+    # splitting required
+    encrypted_key = db.Column(db.LargeBinary, nullable=True)
     
     # Shamir's Secret Sharing metadata
     total_shares = db.Column(db.Integer, default=1)
     threshold = db.Column(db.Integer, default=1)
     
     # Status: active, revoked, rotated
-    status = db.Column(db.String(20), default="active")
+    status = db.Column(db.String(20), default=KeyStatus.ACTIVE.value)
     
     # Timestamps
     created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
     revoked_at = db.Column(db.DateTime, nullable=True)
     
-    # Relationship
-    shares = db.relationship("KeyShare", backref="key_record", lazy="dynamic",
+    # Relationship — plain select loading so list/detail paths can batch it
+    # with selectinload instead of the per-iteration query "dynamic" emits
+    shares = db.relationship("KeyShare", backref="key_record",
                             cascade="all, delete-orphan")
+
+    # retrieve_key hits (media_id, status) on every download
+    __table_args__ = (
+        db.Index("ix_key_records_media_status", "media_id", "status"),
+    )
     
     def __repr__(self):
         return f"<KeyRecord media_id={self.media_id} status={self.status}>"
@@ -203,17 +270,20 @@ class KeyShare(db.Model):
     __tablename__ = "key_shares"
     
     id = db.Column(db.Integer, primary_key=True)
-    key_record_id = db.Column(db.Integer, db.ForeignKey("key_records.id"), nullable=False)
+    # Indexed explicitly — SQLite does not index FK columns automatically
+    key_record_id = db.Column(db.Integer, db.ForeignKey("key_records.id"),
+                              nullable=False, index=True)
     
     # Share data
     share_index = db.Column(db.Integer, nullable=False)  # 1-indexed
-    encrypted_share = db.Column(db.Text, nullable=False)  # Fernet-wrapped share bytes
+    # Raw Fernet token bytes — no UTF-8 decode/encode round-trip per access
+    encrypted_share = db.Column(db.LargeBinary, nullable=False)
     
     # Assigned holder (user who holds this share)
     holder_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=True)
     
     # Status: active, used, revoked
-    status = db.Column(db.String(20), default="active")
+    status = db.Column(db.String(20), default=KeyStatus.ACTIVE.value)
     
     created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
     
@@ -230,31 +300,41 @@ def generate_file_key() -> bytes:
     return AESGCM.generate_key(bit_length=256)
 
 
-def wrap_key(key: bytes) -> str:
-    """Fernet-encrypt a key and return URL-safe string for DB storage."""
-    return _fernet.encrypt(key).decode()
+def wrap_key(key: bytes) -> bytes:
+    """Encrypt a key with AES-256-GCM-SIV, returning token bytes for DB storage."""
+    nonce = os.urandom(_NONCE_SIZE)
+    return _KW_PREFIX + base64.b64encode(nonce + _get_siv().encrypt(nonce, key, None))
 
 
-def unwrap_key(wrapped: str) -> bytes:
-    """Recover raw key bytes from Fernet token."""
-    return _fernet.decrypt(wrapped.encode())
+def unwrap_key(wrapped) -> bytes:
+    """Recover raw key bytes from a token (``kw1:`` or legacy Fernet)."""
+    if isinstance(wrapped, str):
+        wrapped = wrapped.encode()
+    if wrapped.startswith(_KW_PREFIX):
+        blob = base64.b64decode(wrapped[len(_KW_PREFIX):])
+        return _get_siv().decrypt(blob[:_NONCE_SIZE], blob[_NONCE_SIZE:], None)
+    return _get_fernet().decrypt(wrapped)
 
 
 def store_key(media_id: int, key: bytes, n_shares: int = 1, threshold: int = 1,
-              holder_ids: Optional[List[int]] = None) -> KeyRecord:
+              holder_ids: Optional[List[int]] = None, commit: bool = True) -> KeyRecord:
     """
     Store a file encryption key, optionally splitting with Shamir's Secret Sharing.
-    
+
     Args:
         media_id: ID of the associated MediaFile
         key: The raw AES key bytes
         n_shares: Number of shares to split into (1 = no splitting)
         threshold: Minimum shares required to reconstruct
         holder_ids: Optional list of user IDs to assign shares to
-        
+        commit: Commit immediately (False = flush only, caller commits —
+            lets routes batch the key write with their audit log in one commit)
+
     Returns:
         The created KeyRecord
     """
+    _key_cache.pop(media_id, None)  # a new key supersedes any cached one
+
     if n_shares == 1:
         # Simple case: just wrap and store the key
         record = KeyRecord(
@@ -262,10 +342,13 @@ def store_key(media_id: int, key: bytes, n_shares: int = 1, threshold: int = 1,
             encrypted_key=wrap_key(key),
             total_shares=1,
             threshold=1,
-            status="active"
+            status=KeyStatus.ACTIVE.value
         )
         db.session.add(record)
-        db.session.commit()
+        if commit:
+            db.session.commit()
+        else:
+            db.session.flush()
         return record
     
     # Shamir's Secret Sharing case
@@ -281,143 +364,187 @@ def store_key(media_id: int, key: bytes, n_shares: int = 1, threshold: int = 1,
         encrypted_key=None,  # Key is split, not stored directly
         total_shares=n_shares,
         threshold=threshold,
-        status="active"
+        status=KeyStatus.ACTIVE.value
     )
     db.session.add(record)
     db.session.flush()  # Get the ID
     
-    # Store each share
-    for i, (share_idx, share_bytes) in enumerate(shares):
-        holder_id = holder_ids[i] if holder_ids and i < len(holder_ids) else None
-        share = KeyShare(
+    # Wrap and stage all shares in one pass — add_all lets the ORM batch
+    # the INSERTs instead of walking the unit-of-work once per share
+    db.session.add_all([
+        KeyShare(
             key_record_id=record.id,
             share_index=share_idx,
             encrypted_share=wrap_key(share_bytes),
-            holder_id=holder_id,
-            status="active"
+            holder_id=holder_ids[i] if holder_ids and i < len(holder_ids) else None,
+            status=KeyStatus.ACTIVE.value,
         )
-        db.session.add(share)
-    
-    db.session.commit()
+        for i, (share_idx, share_bytes) in enumerate(shares)
+    ])
+
+    if commit:
+        db.session.commit()
+    else:
+        db.session.flush()
     return record
 
 
+# Short-TTL cache of reconstructed keys: repeat downloads of the same media
+# re-derive the same 32-byte key from the same shares every time. revoke_key
+# and rotate_key evict eagerly; the TTL bounds staleness for anything else.
+_KEY_TTL_S = 300.0
+_KEY_CACHE_MAX = 1024
+_key_cache: dict = {}  # media_id -> (monotonic ts, raw key)
+
+
 def retrieve_key(media_id: int, provided_shares: Optional[List[Tuple[int, bytes]]] = None) -> Optional[bytes]:
     """
     Retrieve and reconstruct a file encryption key.
-    
+
+    Results for the standard (no provided shares) path are cached for a few
+    minutes per media_id, skipping the DB fetch, share unwrap and Lagrange
+    interpolation on repeat downloads.
+
     Args:
         media_id: ID of the MediaFile
         provided_shares: For split keys, list of (share_index, share_bytes) tuples
-        
+
     Returns:
         The decryption key, or None if not available/authorized
     """
-    record = KeyRecord.query.filter_by(media_id=media_id, status="active").first()
+    if provided_shares is None:
+        hit = _key_cache.get(media_id)
+        if hit is not None and time.monotonic() - hit[0] < _KEY_TTL_S:
+            return hit[1]
+
+    record = KeyRecord.query.filter_by(media_id=media_id, status=KeyStatus.ACTIVE.value).first()
     if not record:
         return None
-    
+
     if record.total_shares == 1:
         # Simple case: unwrap and return
-        return unwrap_key(record.encrypted_key)
-    
-    # Shamir's case: need to reconstruct from shares
-    if provided_shares:
+        key = unwrap_key(record.encrypted_key)
+    elif provided_shares is not None:
         # Use provided shares
         if len(provided_shares) < record.threshold:
             return None  # Not enough shares
         return reconstruct_secret(provided_shares, 32)  # AES-256 = 32 bytes
-    
-    # Auto-retrieve all active shares (for admin use)
-    shares = KeyShare.query.filter_by(
-        key_record_id=record.id,
-        status="active"
-    ).all()
-    
-    if len(shares) < record.threshold:
-        return None  # Not enough active shares
-    
-    share_data = [(s.share_index, unwrap_key(s.encrypted_share)) for s in shares[:record.threshold]]
-    return reconstruct_secret(share_data, 32)
+    else:
+        # Auto-retrieve all active shares (for admin use) — the relationship
+        # load reuses the record in hand instead of a second filtered query
+        shares = [s for s in record.shares if s.status == KeyStatus.ACTIVE.value]
+
+        if len(shares) < record.threshold:
+            return None  # Not enough active shares
+
+        share_data = [(s.share_index, unwrap_key(s.encrypted_share))
+                      for s in shares[:record.threshold]]
+        key = _reconstruct_aes_key(share_data)
 
+    if len(_key_cache) >= _KEY_CACHE_MAX:
+        _key_cache.clear()
+    _key_cache[media_id] = (time.monotonic(), key)
+    return key
 
-def revoke_key(media_id: int) -> bool:
+
+def revoke_key(media_id: int, commit: bool = True) -> bool:
     """
     Revoke a key, making the file undecryptable.
-    
+
     Args:
         media_id: ID of the MediaFile
-        
+        commit: Commit immediately (False = flush only, caller commits)
+
     Returns:
         True if revoked, False if not found
     """
     record = KeyRecord.query.filter_by(media_id=media_id).first()
     if not record:
         return False
-    
-    record.status = "revoked"
+
+    record.status = KeyStatus.REVOKED.value
     record.revoked_at = datetime.now(timezone.utc)
-    
+    _key_cache.pop(media_id, None)
+
     # Also revoke all shares
     for share in record.shares:
-        share.status = "revoked"
-    
-    db.session.commit()
+        share.status = KeyStatus.REVOKED.value
+
+    if commit:
+        db.session.commit()
+    else:
+        db.session.flush()
     return True
 
 
-def rotate_key(media_id: int, new_key: bytes) -> Optional[KeyRecord]:
+def rotate_key(media_id: int, new_key: bytes, commit: bool = True) -> Optional[KeyRecord]:
     """
-    Rotate (replace) a key. The old key is marked as rotated.
-    
+    Rotate (replace) a key, keeping the old sharing configuration.
+
+    key_records holds one row per media file (media_id is unique), so
+    rotation replaces the record rather than inserting a "rotated"
+    successor row — key history lives in the audit log.
+
     Note: This only updates the key record. The file must be re-encrypted
     separately with the new key.
-    
+
     Args:
         media_id: ID of the MediaFile
         new_key: The new AES key
-        
+        commit: Commit immediately (False = flush only, caller commits —
+            lets the embed task batch the rotation with its media/audit
+            updates into one pre-swap commit)
+
     Returns:
-        The new KeyRecord, or None if original not found
+        The new KeyRecord, or None if no active record was found
     """
-    old_record = KeyRecord.query.filter_by(media_id=media_id, status="active").first()
+    old_record = KeyRecord.query.filter_by(media_id=media_id, status=KeyStatus.ACTIVE.value).first()
     if not old_record:
         return None
-    
-    # Mark old record as rotated
-    old_record.status = "rotated"
-    
-    # Create new record with same sharing config
+
+    n_shares, threshold = old_record.total_shares, old_record.threshold
+    _key_cache.pop(media_id, None)
+
+    # Delete-then-flush frees the unique media_id slot before store_key's
+    # INSERT (flushes emit inserts before deletes, so the order must be
+    # forced here); shares go with the record via the cascade
+    db.session.delete(old_record)
+    db.session.flush()
+
     new_record = store_key(
         media_id=media_id,
         key=new_key,
-        n_shares=old_record.total_shares,
-        threshold=old_record.threshold
+        n_shares=n_shares,
+        threshold=threshold,
+        commit=False
     )
-    
-    db.session.commit()
+
+    if commit:
+        db.session.commit()
+    else:
+        db.session.flush()
     return new_record
 
 
-def get_key_info(media_id: int) -> Optional[dict]:
-    """
-    Get information about a key record (without exposing the actual key).
-    
-    Returns:
-        Dict with key metadata, or None if not found
+def _reconstruct_aes_key(shares: List[Tuple[int, bytes]]) -> bytes:
+    """Reconstruct a 32-byte AES key from trusted, equal-length shares.
+
+    Specialized for the retrieve_key hot path: the Lagrange weights come
+    from the memoized basis cache and the weighted XOR-sum runs as one
+    (k, 32) table-lookup pass with a single reduction — no per-share
+    Python loop and none of the generic-path length validation.
     """
-    record = KeyRecord.query.filter_by(media_id=media_id).first()
-    if not record:
-        return None
-    
-    shares_info = []
-    for share in record.shares:
-        shares_info.append({
-            "index": share.share_index,
-            "holder_id": share.holder_id,
-            "status": share.status
-        })
-    
+    basis = _lagrange_basis(tuple(x for x, _ in shares))
+    np, LOG, EXP = _np_gf()
+    ys = np.stack([np.frombuffer(data, dtype=np.uint8) for _, data in shares])
+    weights = np.array(basis, dtype=np.uint8).reshape(-1, 1)
+    return np.bitwise_xor.reduce(
+        _gf_mul_vec(ys, weights, np, LOG, EXP), axis=0
+    ).tobytes()
+
+
+def _key_info(record: KeyRecord) -> dict:
+    """Format an already-fetched KeyRecord as a metadata dict."""
     return {
         "media_id": record.media_id,
         "status": record.status,
@@ -425,22 +552,45 @@ def get_key_info(media_id: int) -> Optional[dict]:
         "threshold": record.threshold,
         "created_at": record.created_at.isoformat(),
         "revoked_at": record.revoked_at.isoformat() if record.revoked_at else None,
-        "shares": shares_info
+        "shares": [
+            {
+                "index": share.share_index,
+                "holder_id": share.holder_id,
+                "status": share.status,
+            }
+            for share in record.shares
+        ],
     }
 
 
+def get_key_info(media_id: int) -> Optional[dict]:
+    """
+    Get information about a key record (without exposing the actual key).
+
+    Returns:
+        Dict with key metadata, or None if not found
+    """
+    record = KeyRecord.query.filter_by(media_id=media_id).first()
+    if not record:
+        return None
+    return _key_info(record)
+
+
 def list_keys(status: Optional[str] = None) -> List[dict]:
     """
     List all key records, optionally filtered by status.
-    
+
+    One batched query (records + shares via selectinload) instead of the
+    old per-record re-query through get_key_info.
+
     Args:
         status: Filter by status (active, revoked, rotated)
-        
+
     Returns:
         List of key info dicts
     """
-    query = KeyRecord.query
+    query = KeyRecord.query.options(selectinload(KeyRecord.shares))
     if status:
         query = query.filter_by(status=status)
-    
-    return [get_key_info(r.media_id) for r in query.all()]
+
+    return [_key_info(r) for r in query.all()]
@@ -1,31 +1,251 @@
 """Media blueprint — upload, download, dashboard, profile, file detail, verify encryption, admin file listing."""
 
+import io
 import os
-import uuid
+import time
+import secrets
 import hashlib
 import tempfile
 
+import numpy as np
+
 from flask import (
     Blueprint, render_template, redirect, url_for, flash,
-    request, current_app, send_file, abort, jsonify,
+    request, current_app, send_file, abort, jsonify, Response,
 )
 from flask_login import login_required, current_user
+from sqlalchemy.orm import load_only, selectinload, undefer
 from werkzeug.utils import secure_filename
 
 from app import db
 from app.models import MediaFile, AuditLog, User, ShareToken
-from app.encryption import encrypt_file, decrypt_file, unwrap_key
+from app.encryption import encrypt_file, decrypt_file, decrypt_file_stream, unwrap_key
 from app.kms import store_key
 from app.watermark import embed_watermark, extract_watermark, AUDIO_EXTENSIONS, VIDEO_EXTENSIONS
-from app.policy import check_access, share_file, revoke_share, Policy, PolicyType
+from app.policy import (
+    check_access, share_file, revoke_share, shared_media_ids, share_list_user_ids,
+    Policy, PolicyType,
+)
 from app import csrf
+from app import tasks
 
 media_bp = Blueprint("media", __name__)
 
+# Hot-path config captured once at blueprint registration. Going through
+# current_app.config on every request costs a LocalProxy dereference plus a
+# dict lookup for values that never change after startup.
+_UPLOAD_DIR: str = ""
+_ALLOWED_EXTS: frozenset = frozenset()
+_SCRATCH_DIR = None  # tmpfs for plaintext temp files; None = platform default
+_X_ACCEL_URI = None  # nginx internal location for ciphertext downloads
+_WM_VIDEO_STEP = 4   # video embed temporal step (key-frame delta propagation)
+_WM_EXTRACT_FRAMES = 32  # key-frame sample size for video extraction
+
+
+@media_bp.record_once
+def _capture_config(state) -> None:
+    global _UPLOAD_DIR, _ALLOWED_EXTS, _SCRATCH_DIR, _X_ACCEL_URI, \
+        _WM_VIDEO_STEP, _WM_EXTRACT_FRAMES
+    _UPLOAD_DIR = state.app.config["UPLOAD_FOLDER"]
+    _ALLOWED_EXTS = frozenset(state.app.config["ALLOWED_EXTENSIONS"])
+    _SCRATCH_DIR = state.app.config.get("PLAINTEXT_SCRATCH_DIR")
+    _X_ACCEL_URI = state.app.config.get("X_ACCEL_STORAGE_URI")
+    _WM_VIDEO_STEP = state.app.config.get("WATERMARK_VIDEO_STEP", 4)
+    _WM_EXTRACT_FRAMES = state.app.config.get("WM_EXTRACT_FRAMES", 32)
+
+
+# One membership test for "needs watermarking" instead of two
+_MEDIA_EXTS = AUDIO_EXTENSIONS | VIDEO_EXTENSIONS
+
+# Extension → MIME type for everything in ALLOWED_EXTENSIONS. The client-
+# supplied Content-Type is both untrusted and inconsistent across browsers;
+# a static lookup keyed on the validated extension is one dict hit and
+# gives the same file the same MIME type every time.
+_EXT_TO_MIME = {
+    "mp3": "audio/mpeg", "wav": "audio/x-wav", "ogg": "audio/ogg",
+    "flac": "audio/flac", "aac": "audio/aac",
+    "mp4": "video/mp4", "avi": "video/x-msvideo", "mkv": "video/x-matroska",
+    "mov": "video/quicktime", "webm": "video/webm",
+}
+
+
+# Known magic bytes for media formats, longest signature first so the
+# specific match wins over a shorter prefix (e.g. MKV before the loose
+# 3-byte MP4 heuristic). Built once — verify_encryption rebuilt and
+# re-scanned this table per request.
+_MAGIC_SIGS = tuple(sorted({
+    b'\x49\x44\x33': 'MP3 (ID3)',
+    b'\xff\xfb': 'MP3',
+    b'\xff\xf3': 'MP3',
+    b'\x52\x49\x46\x46': 'WAV/AVI (RIFF)',
+    b'\x4f\x67\x67\x53': 'OGG',
+    b'\x66\x4c\x61\x43': 'FLAC',
+    b'\x00\x00\x00': 'MP4/MOV (possible)',
+    b'\x1a\x45\xdf\xa3': 'MKV/WebM',
+}.items(), key=lambda kv: -len(kv[0])))
+
+
+def _allowed(filename: str) -> tuple[bool, str]:
+    """Validate the extension and hand it back so callers don't re-split."""
+    ext = filename.rpartition(".")[2].lower() if "." in filename else ""
+    return ext in _ALLOWED_EXTS, ext
+
+
+def _sample_entropy(sample: bytes):
+    """Shannon entropy (bits/byte) of *sample*, or None if empty."""
+    if not sample:
+        return None
+    counts = np.bincount(np.frombuffer(sample, dtype=np.uint8), minlength=256)
+    p = counts[counts > 0] / len(sample)
+    return float(-(p * np.log2(p)).sum())
+
+
+def _unlink_quiet(path: str) -> None:
+    """Remove *path* if present — one unlink syscall, no stat beforehand."""
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+
+# Columns the file-list views actually render. load_only(*_LIST_COLS) defers
+# the wide encrypted_key text column (and stored_filename), which list pages
+# never touch, cutting DB transfer and ORM hydration per row.
+_LIST_COLS = (
+    MediaFile.id, MediaFile.owner_id, MediaFile.original_filename,
+    MediaFile.file_size, MediaFile.mime_type, MediaFile.status,
+    MediaFile.watermark_payload, MediaFile.watermark_id, MediaFile.created_at,
+)
+
+
+# -------------------------------------------------------------------------
+# Background tasks — watermark work runs off the request thread
+# -------------------------------------------------------------------------
+def _embed_watermark_task(app, media_id: int, tmp_path: str, ext: str,
+                          wm_payload: str) -> None:
+    """Embed the watermark and re-encrypt the stored ciphertext.
+
+    Runs after the upload response has been sent, using the plaintext temp
+    copy the request left behind as the embed source. The re-encrypted file
+    is written to a sidecar and swapped in with os.replace after the new key
+    is committed, so on any failure the original (un-watermarked) ciphertext
+    and key stay valid.
+
+    Audio embeds write the watermarked WAV into an in-memory buffer that
+    feeds encrypt_file directly — the watermarked plaintext never exists as
+    a file. Video keeps the on-disk intermediate: cv2.VideoWriter only
+    writes to a real (seekable) path.
+    """
+    from app.kms import rotate_key
 
-def _allowed(filename: str) -> bool:
-    return "." in filename and \
-        filename.rsplit(".", 1)[1].lower() in current_app.config["ALLOWED_EXTENSIONS"]
+    wm_path = None
+    side_path = None
+    with app.app_context():
+        try:
+            if ext in AUDIO_EXTENSIONS:
+                wm_dst = io.BytesIO()
+            else:
+                wm_fd, wm_path = tempfile.mkstemp(suffix=f".{ext}", dir=_SCRATCH_DIR)
+                os.close(wm_fd)
+                wm_dst = wm_path
+            wm_meta = embed_watermark(tmp_path, wm_dst, wm_payload,
+                                      step_size=_WM_VIDEO_STEP)
+
+            media = db.session.get(MediaFile, media_id)
+            if media is None or media.status != "encrypted":
+                return
+            stored_path = os.path.join(_UPLOAD_DIR, media.stored_filename)
+            side_path = stored_path + ".tmp"
+            if wm_path is None:
+                wm_dst.seek(0)
+            wrapped_key, meta = encrypt_file(wm_dst if wm_path is None else wm_path,
+                                             side_path)
+
+            # Rotate first (flush only) so nothing commits mid-task — the
+            # media fields below describe the sidecar, and they must not
+            # land in the DB until the single commit right before the swap
+            record = rotate_key(media_id, unwrap_key(wrapped_key), commit=False)
+            media.file_size = meta["encrypted_size"]
+            media.sha256_encrypted = meta["cipher_sha256"]
+            media.header_hex = meta["cipher_sample"][:32].hex()
+            media.entropy_bits = _sample_entropy(meta["cipher_sample"])
+            media.watermark_id = wm_meta.get("watermark_id", "")
+            if record is not None:
+                # Mirror the KMS token (see upload)
+                media.encrypted_key = record.encrypted_key.decode()
+            else:
+                media.encrypted_key = wrapped_key
+            db.session.add(AuditLog(
+                user_id=media.owner_id, action="watermark_embed",
+                media_id=media.id, result="success",
+                detail=(
+                    f"wm_id={wm_meta.get('watermark_id','')}"
+                    f" snr={wm_meta.get('snr_db', wm_meta.get('avg_psnr_db', 'n/a'))}"
+                ),
+            ))
+            db.session.commit()
+            # Swap last: until here every failure path leaves the original
+            # ciphertext + key pair intact
+            os.replace(side_path, stored_path)
+            side_path = None
+        except Exception as wm_err:
+            db.session.rollback()
+            app.logger.warning(f"Watermark skipped: {wm_err}")
+            db.session.add(AuditLog(
+                user_id=None, action="watermark_embed",
+                media_id=media_id, result="skipped", detail=str(wm_err),
+            ))
+            db.session.commit()
+        finally:
+            for path in (tmp_path, wm_path, side_path):
+                if path:
+                    _unlink_quiet(path)
+
+
+def _unlink_file_task(app, path: str) -> None:
+    """Fire-and-forget ciphertext removal — delete responses return without
+    waiting on the filesystem (network-backed storage can make unlink slow)."""
+    _unlink_quiet(path)
+
+
+def _verify_watermark_task(app, user_id: int, media_id: int,
+                           expected_payload: str, payload_len: int) -> None:
+    """Post-download watermark check — result is audit-only, so it no
+    longer holds up the HTTP response. Downloads stream the plaintext
+    straight to the client, so the task decrypts its own scratch copy
+    for extraction and cleans it up when done."""
+    with app.app_context():
+        tmp_path = None
+        try:
+            media = db.session.get(MediaFile, media_id)
+            if media is None:
+                return
+            enc_path = os.path.join(_UPLOAD_DIR, media.stored_filename)
+            tmp_fd, tmp_path = tempfile.mkstemp(
+                suffix=f"_{media.original_filename}", dir=_SCRATCH_DIR)
+            os.close(tmp_fd)
+            decrypt_file(enc_path, tmp_path, media.encrypted_key)
+            wm_verify = extract_watermark(tmp_path, payload_len,
+                                          n_frames=_WM_EXTRACT_FRAMES)
+            if wm_verify.get("payload") == expected_payload:
+                result, detail = "success", "wm_match=True"
+            else:
+                result, detail = "mismatch", "wm_match=False"
+                app.logger.warning(
+                    f"Watermark mismatch for file {media_id}: "
+                    f"expected={expected_payload!r} got={wm_verify.get('payload')!r}"
+                )
+        except Exception as e:
+            result, detail = "error", f"wm_match=error {e}"
+            app.logger.warning(f"Watermark extraction failed for file {media_id}: {e}")
+        finally:
+            if tmp_path:
+                _unlink_quiet(tmp_path)
+        db.session.add(AuditLog(
+            user_id=user_id, action="watermark_verify",
+            media_id=media_id, result=result, detail=detail,
+        ))
+        db.session.commit()
 
 
 # -------------------------------------------------------------------------
@@ -35,22 +255,19 @@ def _allowed(filename: str) -> bool:
 def dashboard():
     if not current_user.is_authenticated:
         return render_template("home.html")
-    files = MediaFile.query.filter_by(owner_id=current_user.id, status="encrypted").all()
-
-    # Fetch files shared with the current user via policies
-    shared_policies = Policy.query.filter(
-        Policy.policy_type.in_([PolicyType.SHARED.value, PolicyType.TIME_LIMITED.value]),
-        Policy.enabled == True,
+    uid = current_user.id  # one proxy dereference instead of one per use
+    files = MediaFile.query.options(load_only(*_LIST_COLS)).filter_by(
+        owner_id=uid, status="encrypted"
     ).all()
-    shared_file_ids = set()
-    for p in shared_policies:
-        if current_user.id in p.get_allowed_users():
-            if p.media_id:
-                shared_file_ids.add(p.media_id)
+
+    # Files shared with the current user — the membership test runs in SQL
+    # (see policy.shared_media_ids), so cost tracks this user's share count
+    # rather than every policy in the system
+    shared_file_ids = shared_media_ids(uid)
     # Exclude own files, only include active encrypted files
-    shared_files = MediaFile.query.filter(
+    shared_files = MediaFile.query.options(load_only(*_LIST_COLS)).filter(
         MediaFile.id.in_(shared_file_ids),
-        MediaFile.owner_id != current_user.id,
+        MediaFile.owner_id != uid,
         MediaFile.status == "encrypted",
     ).all() if shared_file_ids else []
 
@@ -69,82 +286,87 @@ def upload():
             flash("No file selected.", "warning")
             return redirect(request.url)
 
-        if not _allowed(f.filename):
+        allowed, ext = _allowed(f.filename)
+        if not allowed:
             flash("File type not allowed.", "danger")
             return redirect(request.url)
 
+        uid = current_user.id
         original_name = secure_filename(f.filename)
-        ext = original_name.rsplit(".", 1)[1].lower()
-        stored_name = f"{uuid.uuid4().hex}.{ext}.enc"
-        stored_path = os.path.join(current_app.config["UPLOAD_FOLDER"], stored_name)
+        stored_name = f"{secrets.token_hex(16)}.{ext}.enc"
+        stored_path = os.path.join(_UPLOAD_DIR, stored_name)
 
         # Build watermark payload: user ID + timestamp
-        import time as _time
-        wm_payload = f"uid:{current_user.id}|ts:{int(_time.time())}"
+        wm_payload = f"uid:{uid}|ts:{int(time.time())}"
 
-        # Save temp unencrypted copy
-        tmp_fd, tmp_path = tempfile.mkstemp(suffix=f".{ext}")
-        wm_path = None
-        wm_meta = {}
+        tmp_path = None
         try:
-            f.save(tmp_path)
-
-            # --- Phase 3: embed watermark before encryption ---
-            if ext in AUDIO_EXTENSIONS or ext in VIDEO_EXTENSIONS:
-                wm_fd, wm_path = tempfile.mkstemp(suffix=f".{ext}")
-                os.close(wm_fd)
-                try:
-                    wm_meta = embed_watermark(tmp_path, wm_path, wm_payload)
-                    encrypt_src = wm_path      # encrypt the watermarked version
-                except Exception as wm_err:
-                    # If watermarking fails (e.g. file too short), encrypt original
-                    current_app.logger.warning(f"Watermark skipped: {wm_err}")
-                    encrypt_src = tmp_path
-                    wm_meta = {"skipped": str(wm_err)}
+            if ext in _MEDIA_EXTS:
+                # Watermark embedding (pydub/cv2) needs an on-disk plaintext
+                # source. The temp copy doubles as the embed input for the
+                # background task scheduled after the commit below.
+                tmp_fd, tmp_path = tempfile.mkstemp(suffix=f".{ext}", dir=_SCRATCH_DIR)
+                os.close(tmp_fd)
+                f.save(tmp_path, buffer_size=1024 * 1024)
+                wrapped_key, meta = encrypt_file(tmp_path, stored_path)
             else:
-                encrypt_src = tmp_path
-
-            wrapped_key, meta = encrypt_file(encrypt_src, stored_path)
-        finally:
-            os.close(tmp_fd)
-            if os.path.exists(tmp_path):
-                os.unlink(tmp_path)
-            if wm_path and os.path.exists(wm_path):
-                os.unlink(wm_path)
-
-        media = MediaFile(
-            owner_id=current_user.id,
-            original_filename=original_name,
-            stored_filename=stored_name,
-            file_size=meta["encrypted_size"],
-            mime_type=f.content_type,
-            encrypted_key=wrapped_key,
-            watermark_payload=wm_payload,
-            watermark_id=wm_meta.get("watermark_id", ""),
-        )
-        db.session.add(media)
-        db.session.commit()
+                # Pipe the upload straight into encryption — plaintext never
+                # touches disk and only the ciphertext is written once
+                wrapped_key, meta = encrypt_file(f.stream, stored_path)
+
+            media = MediaFile(
+                owner_id=uid,
+                original_filename=original_name,
+                stored_filename=stored_name,
+                file_size=meta["encrypted_size"],
+                mime_type=_EXT_TO_MIME.get(ext, f.mimetype),
+                sha256_encrypted=meta["cipher_sha256"],
+                header_hex=meta["cipher_sample"][:32].hex(),
+                entropy_bits=_sample_entropy(meta["cipher_sample"]),
+                encrypted_key=wrapped_key,
+                watermark_payload=wm_payload,
+                watermark_payload_len=len(wm_payload.encode("utf-8")),
+                watermark_id="",  # filled in by the background embed task
+            )
+            db.session.add(media)
+            db.session.flush()  # assigns media.id without an fsync
 
-        # Create KMS record (so Admin → Key Management is populated)
-        try:
-            raw_key = unwrap_key(wrapped_key)
-            record = store_key(media.id, raw_key)
-            media.encrypted_key = record.encrypted_key
+            # Create KMS record (so Admin → Key Management is populated)
+            try:
+                raw_key = unwrap_key(wrapped_key)
+                record = store_key(media.id, raw_key, commit=False)
+                # MediaFile.encrypted_key is still a Text column — store the
+                # KMS token in its str form there
+                media.encrypted_key = record.encrypted_key.decode()
+            except Exception as kms_err:
+                current_app.logger.warning(f"KMS record not created: {kms_err}")
+
+            # Media row, KMS record and audit log land in a single commit
+            db.session.add(AuditLog(
+                user_id=uid, action="upload",
+                media_id=media.id, result="success",
+                detail=(
+                    f"size={meta['original_size']} enc_time={meta['encryption_time_s']}s"
+                    f" wm={'deferred' if tmp_path else 'n/a'}"
+                ),
+            ))
             db.session.commit()
-        except Exception as kms_err:
-            current_app.logger.warning(f"KMS record not created: {kms_err}")
-
-        db.session.add(AuditLog(
-            user_id=current_user.id, action="upload",
-            media_id=media.id, result="success",
-            detail=(
-                f"size={meta['original_size']} enc_time={meta['encryption_time_s']}s"
-                f" wm_id={wm_meta.get('watermark_id','')} snr={wm_meta.get('snr_db', wm_meta.get('avg_psnr_db','n/a'))}"
-            ),
-        ))
-        db.session.commit()
-
-        flash(f"'{original_name}' watermarked, encrypted & stored successfully.", "success")
+        except Exception:
+            # The embed task owns tmp_path only once submitted below — until
+            # then a failed save/encrypt/commit must not leave the plaintext
+            # scratch copy (tmpfs) or a partial ciphertext behind
+            for path in (tmp_path, stored_path):
+                if path:
+                    _unlink_quiet(path)
+            raise
+
+        # Watermark embedding (plus re-encryption) happens off the request
+        # thread; until it lands, the un-watermarked ciphertext serves
+        if tmp_path:
+            tasks.submit(current_app._get_current_object(), _embed_watermark_task,
+                         media.id, tmp_path, ext, wm_payload)
+
+        flash(f"'{original_name}' encrypted & stored successfully.", "success")
         return redirect(url_for("media.dashboard"))
 
     return render_template("upload.html")
@@ -156,22 +378,27 @@ def upload():
 @media_bp.route("/download/<int:file_id>")
 @login_required
 def download(file_id: int):
-    media = db.session.get(MediaFile, file_id)
+    # The one route that needs the wrapped key — undefer it up front so it
+    # arrives with the row instead of via a second lazy SELECT
+    media = db.session.get(MediaFile, file_id,
+                           options=[undefer(MediaFile.encrypted_key)])
     if not media or media.status != "encrypted":
         abort(404)
 
+    uid = current_user.id
+
     # Policy Engine check (Phase 4)
     allowed, reason = check_access(
-        user_id=current_user.id,
+        user_id=uid,
         user_role=current_user.role,
         file_id=media.id,
         file_owner_id=media.owner_id,
         action="decrypt"
     )
-    
+
     if not allowed:
         db.session.add(AuditLog(
-            user_id=current_user.id, action="download",
+            user_id=uid, action="download",
             media_id=media.id, result="denied",
             detail=f"Policy denied: {reason}"
         ))
@@ -179,49 +406,57 @@ def download(file_id: int):
         flash(f"Access denied: {reason}", "danger")
         return redirect(url_for("media.dashboard"))
 
-    enc_path = os.path.join(current_app.config["UPLOAD_FOLDER"], media.stored_filename)
-    if not os.path.isfile(enc_path):
-        abort(404)
+    enc_path = os.path.join(_UPLOAD_DIR, media.stored_filename)
 
-    # Decrypt to a temp file, then stream it back
-    tmp_fd, tmp_path = tempfile.mkstemp(suffix=f"_{media.original_filename}")
+    # Stream decrypted chunks straight to the client — no plaintext temp
+    # file on the request path, and the first byte ships after one chunk
+    # instead of after a full-file decrypt. No pre-flight stat either: the
+    # DB row is authoritative, and a missing ciphertext surfaces as
+    # FileNotFoundError on the first open (a stat beforehand only raced it).
     try:
-        os.close(tmp_fd)
-        meta = decrypt_file(enc_path, tmp_path, media.encrypted_key)
+        stream = decrypt_file_stream(enc_path, media.encrypted_key)
+        first = next(stream, b"")  # surface key/corruption errors early
+    except FileNotFoundError:
+        abort(404)
     except Exception:
-        os.unlink(tmp_path)
         flash("Decryption failed — file may be corrupted.", "danger")
         return redirect(url_for("media.dashboard"))
 
-    # --- Phase 3: verify watermark after decryption ---
-    wm_verify = {}
-    if media.watermark_payload:
-        try:
-            payload_len = len(media.watermark_payload.encode("utf-8"))
-            wm_verify = extract_watermark(tmp_path, payload_len)
-            if wm_verify.get("payload") != media.watermark_payload:
-                wm_verify["match"] = False
-                current_app.logger.warning(
-                    f"Watermark mismatch for file {media.id}: "
-                    f"expected={media.watermark_payload!r} got={wm_verify.get('payload')!r}"
-                )
-            else:
-                wm_verify["match"] = True
-        except Exception as e:
-            wm_verify = {"match": "error", "detail": str(e)}
-            current_app.logger.warning(f"Watermark extraction failed for file {media.id}: {e}")
-
+    # Verify only files whose embed actually landed — watermark_id is set
+    # when the background embed commits, while watermark_payload exists
+    # from upload time. Checking the payload alone fired verification
+    # (and logged false mismatches) during the embed window and for
+    # files whose embed was skipped.
+    wm_embedded = bool(media.watermark_id and media.watermark_payload)
+    wm_detail = "wm_match=deferred" if wm_embedded else "wm_match=n/a"
     db.session.add(AuditLog(
-        user_id=current_user.id, action="download",
+        user_id=uid, action="download",
         media_id=media.id, result="success",
-        detail=f"dec_time={meta['decryption_time_s']}s wm_match={wm_verify.get('match', 'n/a')}",
+        detail=f"streamed {wm_detail}",
     ))
     db.session.commit()
 
-    return send_file(
-        tmp_path,
-        as_attachment=True,
-        download_name=media.original_filename,
+    if wm_embedded:
+        # Length is fixed at embed time; pre-column rows fall back to
+        # computing it from the payload. Verification is audit-only and
+        # decrypts its own scratch copy off the request thread.
+        payload_len = media.watermark_payload_len or \
+            len(media.watermark_payload.encode("utf-8"))
+        tasks.submit(current_app._get_current_object(), _verify_watermark_task,
+                     uid, media.id, media.watermark_payload, payload_len)
+
+    def generate():
+        yield first
+        yield from stream
+
+    return Response(
+        generate(),
+        mimetype=media.mime_type or "application/octet-stream",
+        headers={
+            "Content-Disposition": f'attachment; filename="{media.original_filename}"',
+            # stored layout is nonce (12) || ciphertext || tag (16)
+            "Content-Length": str(os.path.getsize(enc_path) - 28),
+        },
     )
 
 
@@ -235,9 +470,11 @@ def download_encrypted(file_id: int):
     if not media or media.status != "encrypted":
         abort(404)
 
+    uid = current_user.id
+
     # Policy Engine check — same as decrypt download
     allowed, reason = check_access(
-        user_id=current_user.id,
+        user_id=uid,
         user_role=current_user.role,
         file_id=media.id,
         file_owner_id=media.owner_id,
@@ -247,27 +484,44 @@ def download_encrypted(file_id: int):
         flash(f"Access denied: {reason}", "danger")
         return redirect(url_for("media.dashboard"))
 
-    enc_path = os.path.join(current_app.config["UPLOAD_FOLDER"], media.stored_filename)
-    if not os.path.isfile(enc_path):
-        abort(404)
+    enc_path = os.path.join(_UPLOAD_DIR, media.stored_filename)
 
     # Serve the raw encrypted file with .enc extension so it's clearly ciphertext
     name_parts = media.original_filename.rsplit(".", 1)
     enc_name = f"{name_parts[0]}_encrypted.{name_parts[1]}.enc" if len(name_parts) == 2 else f"{media.original_filename}.enc"
 
     db.session.add(AuditLog(
-        user_id=current_user.id, action="download_encrypted",
+        user_id=uid, action="download_encrypted",
         media_id=media.id, result="success",
         detail="Raw encrypted file downloaded (ciphertext)",
     ))
     db.session.commit()
 
-    return send_file(
-        enc_path,
-        as_attachment=True,
-        download_name=enc_name,
-        mimetype="application/octet-stream",
-    )
+    # Hand the transfer to nginx when configured — the response carries
+    # only headers and nginx does a zero-copy sendfile(2) from the
+    # internal storage location, freeing this worker immediately (nginx
+    # answers 404 itself if the file has vanished)
+    if _X_ACCEL_URI:
+        return Response(
+            "",
+            mimetype="application/octet-stream",
+            headers={
+                "Content-Disposition": f'attachment; filename="{enc_name}"',
+                "X-Accel-Redirect": f"{_X_ACCEL_URI}/{media.stored_filename}",
+            },
+        )
+
+    # No pre-flight stat — send_file opens the file itself, so a vanished
+    # ciphertext shows up right here instead of racing an isfile() check
+    try:
+        return send_file(
+            enc_path,
+            as_attachment=True,
+            download_name=enc_name,
+            mimetype="application/octet-stream",
+        )
+    except FileNotFoundError:
+        abort(404)
 
 
 # -------------------------------------------------------------------------
@@ -280,17 +534,17 @@ def delete(file_id: int):
     if not media:
         abort(404)
 
-    if media.owner_id != current_user.id and not current_user.is_admin:
+    uid = current_user.id
+    if media.owner_id != uid and not current_user.is_admin:
         abort(403)
 
-    enc_path = os.path.join(current_app.config["UPLOAD_FOLDER"], media.stored_filename)
-    if os.path.isfile(enc_path):
-        os.unlink(enc_path)
+    enc_path = os.path.join(_UPLOAD_DIR, media.stored_filename)
+    tasks.submit(current_app._get_current_object(), _unlink_file_task, enc_path)
 
     media.status = "deleted"
     media.encrypted_key = None
     db.session.add(AuditLog(
-        user_id=current_user.id, action="delete",
+        user_id=uid, action="delete",
         media_id=media.id, result="success",
     ))
     db.session.commit()
@@ -307,7 +561,11 @@ def delete(file_id: int):
 def admin_files():
     if not current_user.is_admin:
         abort(403)
-    files = MediaFile.query.order_by(MediaFile.created_at.desc()).all()
+    # selectinload batches the owner rows into one IN query — the template
+    # shows f.owner.username, which otherwise lazy-loads one user per file
+    files = MediaFile.query.options(
+        load_only(*_LIST_COLS), selectinload(MediaFile.owner)
+    ).order_by(MediaFile.created_at.desc()).all()
     return render_template("admin_files.html", files=files)
 
 
@@ -317,14 +575,15 @@ def admin_files():
 @media_bp.route("/profile")
 @login_required
 def profile():
+    uid = current_user.id
     total_files = MediaFile.query.filter_by(
-        owner_id=current_user.id, status="encrypted"
+        owner_id=uid, status="encrypted"
     ).count()
     total_size = db.session.query(
         db.func.coalesce(db.func.sum(MediaFile.file_size), 0)
-    ).filter_by(owner_id=current_user.id, status="encrypted").scalar()
+    ).filter_by(owner_id=uid, status="encrypted").scalar()
     recent_logs = AuditLog.query.filter_by(
-        user_id=current_user.id
+        user_id=uid
     ).order_by(AuditLog.timestamp.desc()).limit(20).all()
     return render_template(
         "profile.html",
@@ -345,17 +604,11 @@ def file_detail(file_id: int):
         abort(404)
 
     # Allow owner, admin, or users the file is shared with
-    is_owner = media.owner_id == current_user.id
+    uid = current_user.id
+    is_owner = media.owner_id == uid
     is_admin = current_user.is_admin
-    shared_policies = Policy.query.filter(
-        Policy.media_id == media.id,
-        Policy.policy_type.in_([PolicyType.SHARED.value, PolicyType.TIME_LIMITED.value]),
-        Policy.enabled == True
-    ).all()
-    shared_user_ids = set()
-    for p in shared_policies:
-        shared_user_ids.update(p.get_allowed_users())
-    is_shared_with_me = current_user.id in shared_user_ids
+    shared_user_ids = share_list_user_ids(media.id)
+    is_shared_with_me = uid in shared_user_ids
 
     if not is_owner and not is_admin and not is_shared_with_me:
         abort(403)
@@ -370,8 +623,14 @@ def file_detail(file_id: int):
     if is_owner or is_admin:
         all_users = User.query.filter(User.id != media.owner_id).order_by(User.username).all()
 
-    # Get users currently shared with (resolve IDs to objects)
-    shared_users = User.query.filter(User.id.in_(shared_user_ids)).all() if shared_user_ids else []
+    # Resolve share-list IDs to users — reuse the already-fetched list
+    # (share lists never contain the owner) instead of a second query
+    if not shared_user_ids:
+        shared_users = []
+    elif all_users:
+        shared_users = [u for u in all_users if u.id in shared_user_ids]
+    else:
+        shared_users = User.query.filter(User.id.in_(shared_user_ids)).all()
 
     return render_template(
         "file_detail.html", media=media, logs=logs,
@@ -389,7 +648,8 @@ def share(file_id: int):
     media = db.session.get(MediaFile, file_id)
     if not media:
         abort(404)
-    if media.owner_id != current_user.id and not current_user.is_admin:
+    uid = current_user.id
+    if media.owner_id != uid and not current_user.is_admin:
         abort(403)
 
     user_ids = request.form.getlist("user_ids", type=int)
@@ -397,11 +657,14 @@ def share(file_id: int):
         flash("Select at least one user to share with.", "warning")
         return redirect(url_for("media.file_detail", file_id=media.id))
 
-    # Validate user IDs exist and aren't the owner
-    valid_ids = [
-        u.id for u in User.query.filter(User.id.in_(user_ids)).all()
-        if u.id != media.owner_id
-    ]
+    # Validate user IDs exist and aren't the owner. One lookup serves both
+    # validation and the audit/flash username list below.
+    users = {
+        u.id: u.username
+        for u in User.query.options(load_only(User.id, User.username))
+        .filter(User.id.in_(user_ids))
+    }
+    valid_ids = [i for i in users if i != media.owner_id]
 
     # Permissions from form
     permission = request.form.get("permission", "stream")
@@ -409,24 +672,27 @@ def share(file_id: int):
     ttl_hours = request.form.get("ttl_hours", 24, type=int)
 
     if valid_ids:
-        # Create policy-level share (existing behaviour)
-        share_file(media.id, current_user.id, valid_ids)
+        # Create policy-level share (existing behaviour). Everything below
+        # flushes into one transaction — a single commit (and fsync) per
+        # share instead of one per recipient.
+        share_file(media.id, uid, valid_ids, commit=False)
 
         # Create per-user ShareToken for encrypted delivery
         created_tokens = []
-        for uid in valid_ids:
+        for recipient_id in valid_ids:
             tok = ShareToken.create(
                 media_id=media.id,
-                sender_id=current_user.id,
-                recipient_id=uid,
+                sender_id=uid,
+                recipient_id=recipient_id,
                 allow_download=allow_download,
                 ttl_hours=ttl_hours,
+                commit=False,
             )
             created_tokens.append(tok)
 
-        usernames = [u.username for u in User.query.filter(User.id.in_(valid_ids)).all()]
+        usernames = [users[i] for i in valid_ids]
         db.session.add(AuditLog(
-            user_id=current_user.id, action="share",
+            user_id=uid, action="share",
             media_id=media.id, result="success",
             detail=f"Shared with: {', '.join(usernames)} | download={allow_download} ttl={ttl_hours}h",
         ))
@@ -447,7 +713,8 @@ def revoke(file_id: int, user_id: int):
     media = db.session.get(MediaFile, file_id)
     if not media:
         abort(404)
-    if media.owner_id != current_user.id and not current_user.is_admin:
+    uid = current_user.id
+    if media.owner_id != uid and not current_user.is_admin:
         abort(403)
 
     target_user = db.session.get(User, user_id)
@@ -460,10 +727,10 @@ def revoke(file_id: int, user_id: int):
         ShareToken.status != "revoked",
     ).all()
     for tok in active_tokens:
-        tok.revoke()
+        tok.revoke(commit=False)
 
     db.session.add(AuditLog(
-        user_id=current_user.id, action="revoke_share",
+        user_id=uid, action="revoke_share",
         media_id=media.id, result="success",
         detail=f"Revoked access + {len(active_tokens)} token(s) for: {target_user.username if target_user else user_id}",
     ))
@@ -482,77 +749,62 @@ def verify_encryption(file_id: int):
     media = db.session.get(MediaFile, file_id)
     if not media:
         abort(404)
-    if media.owner_id != current_user.id and not current_user.is_admin:
+    uid = current_user.id
+    if media.owner_id != uid and not current_user.is_admin:
         abort(403)
 
     from app.kms import KeyRecord
 
     checks = {}
 
-    # 1. File on disk
-    enc_path = os.path.join(current_app.config["UPLOAD_FOLDER"], media.stored_filename)
-    file_exists = os.path.isfile(enc_path)
+    # 1. File on disk — one stat does double duty as the existence check
+    # and the size read (the old isfile + getsize pair stat'ed twice)
+    enc_path = os.path.join(_UPLOAD_DIR, media.stored_filename)
+    try:
+        stored_size = os.path.getsize(enc_path)
+        file_exists = True
+    except OSError:
+        file_exists = False
     checks["file_on_disk"] = file_exists
 
     if file_exists:
-        # 2. Read raw header — AES-GCM output starts with 12-byte nonce (random)
-        with open(enc_path, "rb") as fh:
-            raw_header = fh.read(64)
-            fh.seek(0, 2)
-            raw_size = fh.tell()
-
         checks["stored_filename"] = media.stored_filename
-        checks["stored_size_bytes"] = raw_size
-        checks["raw_hex_header"] = raw_header[:32].hex()
+        checks["stored_size_bytes"] = stored_size
+
+        # 2-5. Header / playability / entropy / SHA-256. These are all
+        # properties of the immutable ciphertext, fingerprinted while it
+        # was written (see encrypt_file) — rows carrying them skip the
+        # full-file re-read; older rows fall back to scanning the file.
+        if media.sha256_encrypted:
+            raw_header = bytes.fromhex(media.header_hex or "")
+            entropy = media.entropy_bits
+            sha_hex = media.sha256_encrypted
+        else:
+            # One open serves all three reads: the header is the first 64
+            # bytes of the entropy sample, and file_digest rewinds to
+            # hash the whole file from the same handle.
+            with open(enc_path, "rb") as fh:
+                sample = fh.read(1024)
+                fh.seek(0)
+                sha_hex = hashlib.file_digest(fh, "sha256").hexdigest()
+            raw_header = sample[:64]
+            entropy = _sample_entropy(sample)
 
-        # 3. Check if file is playable (valid media headers)
-        # Known magic bytes for media formats
-        magic_sigs = {
-            b'\x49\x44\x33': 'MP3 (ID3)',
-            b'\xff\xfb': 'MP3',
-            b'\xff\xf3': 'MP3',
-            b'\x52\x49\x46\x46': 'WAV/AVI (RIFF)',
-            b'\x4f\x67\x67\x53': 'OGG',
-            b'\x66\x4c\x61\x43': 'FLAC',
-            b'\x00\x00\x00': 'MP4/MOV (possible)',
-            b'\x1a\x45\xdf\xa3': 'MKV/WebM',
-        }
-        detected_format = None
-        for sig, fmt in magic_sigs.items():
-            if raw_header[:len(sig)] == sig:
-                detected_format = fmt
-                break
+        checks["raw_hex_header"] = raw_header[:32].hex()
 
+        detected_format = next(
+            (fmt for sig, fmt in _MAGIC_SIGS if raw_header.startswith(sig)), None
+        )
         checks["raw_file_playable"] = detected_format is not None
         checks["detected_format"] = detected_format  # None = not recognisable = encrypted ✓
 
-        # 4. Shannon entropy of first 1024 bytes (encrypted data ≈ 7.9+ bits/byte)
-        with open(enc_path, "rb") as fh:
-            sample = fh.read(1024)
-        if sample:
-            import math
-            freq = [0] * 256
-            for b in sample:
-                freq[b] += 1
-            entropy = 0.0
-            for count in freq:
-                if count > 0:
-                    p = count / len(sample)
-                    entropy -= p * math.log2(p)
+        if entropy is not None:
             checks["entropy_bits_per_byte"] = round(entropy, 3)
             checks["entropy_verdict"] = (
                 "high (encrypted)" if entropy > 7.5 else "medium" if entropy > 6.0 else "low (likely unencrypted)"
             )
 
-        # 5. SHA-256 hash of stored (encrypted) file
-        sha = hashlib.sha256()
-        with open(enc_path, "rb") as fh:
-            while True:
-                chunk = fh.read(65536)
-                if not chunk:
-                    break
-                sha.update(chunk)
-        checks["sha256_encrypted"] = sha.hexdigest()
+        checks["sha256_encrypted"] = sha_hex
 
     # 6. Encryption key present?
     checks["encrypted_key_present"] = bool(media.encrypted_key)
@@ -566,7 +818,7 @@ def verify_encryption(file_id: int):
         checks["kms_status"] = kms_record.status
         checks["kms_total_shares"] = kms_record.total_shares
         checks["kms_threshold"] = kms_record.threshold
-        checks["kms_shares_count"] = kms_record.shares.count()
+        checks["kms_shares_count"] = len(kms_record.shares)
 
     # 8. Watermark info
     checks["watermark_embedded"] = bool(media.watermark_id)
@@ -587,7 +839,7 @@ def verify_encryption(file_id: int):
 
     # Log the verification
     db.session.add(AuditLog(
-        user_id=current_user.id, action="verify",
+        user_id=uid, action="verify",
         media_id=media.id, result="success",
     ))
     db.session.commit()
@@ -603,19 +855,27 @@ def verify_encryption(file_id: int):
 @csrf.exempt
 def api_files():
     """API: list current user's encrypted files."""
-    files = MediaFile.query.filter_by(
-        owner_id=current_user.id, status="encrypted"
+    # Plain column select — Row tuples skip ORM object construction entirely
+    # for a response that is an immediate JSON projection anyway
+    rows = db.session.execute(
+        db.select(
+            MediaFile.id, MediaFile.original_filename, MediaFile.file_size,
+            MediaFile.mime_type, MediaFile.watermark_id, MediaFile.created_at,
+        ).where(
+            MediaFile.owner_id == current_user.id,
+            MediaFile.status == "encrypted",
+        )
     ).all()
     return jsonify([
         {
-            "id": f.id,
-            "filename": f.original_filename,
-            "size": f.file_size,
-            "mime_type": f.mime_type,
-            "watermark_id": f.watermark_id,
-            "created_at": f.created_at.isoformat(),
+            "id": r.id,
+            "filename": r.original_filename,
+            "size": r.file_size,
+            "mime_type": r.mime_type,
+            "watermark_id": r.watermark_id,
+            "created_at": r.created_at.isoformat(),
         }
-        for f in files
+        for r in rows
     ])
 
 
@@ -649,67 +909,70 @@ def api_upload():
     f = request.files.get("file")
     if not f or f.filename == "":
         return jsonify({"error": "No file selected"}), 400
-    if not _allowed(f.filename):
+    allowed, ext = _allowed(f.filename)
+    if not allowed:
         return jsonify({"error": "File type not allowed"}), 400
 
+    uid = current_user.id
     original_name = secure_filename(f.filename)
-    ext = original_name.rsplit(".", 1)[1].lower()
-    stored_name = f"{uuid.uuid4().hex}.{ext}.enc"
-    stored_path = os.path.join(current_app.config["UPLOAD_FOLDER"], stored_name)
+    stored_name = f"{secrets.token_hex(16)}.{ext}.enc"
+    stored_path = os.path.join(_UPLOAD_DIR, stored_name)
 
-    import time as _time
-    wm_payload = f"uid:{current_user.id}|ts:{int(_time.time())}"
+    wm_payload = f"uid:{uid}|ts:{int(time.time())}"
 
-    tmp_fd, tmp_path = tempfile.mkstemp(suffix=f".{ext}")
-    wm_path = None
-    wm_meta: dict = {}
+    tmp_path = None
     try:
-        f.save(tmp_path)
-        if ext in AUDIO_EXTENSIONS or ext in VIDEO_EXTENSIONS:
-            wm_fd, wm_path = tempfile.mkstemp(suffix=f".{ext}")
-            os.close(wm_fd)
-            try:
-                wm_meta = embed_watermark(tmp_path, wm_path, wm_payload)
-                encrypt_src = wm_path
-            except Exception as wm_err:
-                current_app.logger.warning(f"Watermark skipped: {wm_err}")
-                encrypt_src = tmp_path
-                wm_meta = {"skipped": str(wm_err)}
+        if ext in _MEDIA_EXTS:
+            # Temp plaintext copy doubles as the background embed source
+            tmp_fd, tmp_path = tempfile.mkstemp(suffix=f".{ext}", dir=_SCRATCH_DIR)
+            os.close(tmp_fd)
+            f.save(tmp_path, buffer_size=1024 * 1024)
+            wrapped_key, meta = encrypt_file(tmp_path, stored_path)
         else:
-            encrypt_src = tmp_path
-        wrapped_key, meta = encrypt_file(encrypt_src, stored_path)
-    finally:
-        os.close(tmp_fd)
-        if os.path.exists(tmp_path):
-            os.unlink(tmp_path)
-        if wm_path and os.path.exists(wm_path):
-            os.unlink(wm_path)
-
-    media = MediaFile(
-        owner_id=current_user.id,
-        original_filename=original_name,
-        stored_filename=stored_name,
-        file_size=meta["encrypted_size"],
-        mime_type=f.content_type,
-        encrypted_key=wrapped_key,
-        watermark_payload=wm_payload,
-        watermark_id=wm_meta.get("watermark_id", ""),
-    )
-    db.session.add(media)
-    db.session.commit()
+            # Stream the upload straight into encryption — no plaintext on disk
+            wrapped_key, meta = encrypt_file(f.stream, stored_path)
 
-    db.session.add(AuditLog(
-        user_id=current_user.id, action="upload",
-        media_id=media.id, result="success",
-        detail=f"api_upload size={meta['original_size']}",
-    ))
-    db.session.commit()
+        media = MediaFile(
+            owner_id=uid,
+            original_filename=original_name,
+            stored_filename=stored_name,
+            file_size=meta["encrypted_size"],
+            mime_type=_EXT_TO_MIME.get(ext, f.mimetype),
+            sha256_encrypted=meta["cipher_sha256"],
+            header_hex=meta["cipher_sample"][:32].hex(),
+            entropy_bits=_sample_entropy(meta["cipher_sample"]),
+            encrypted_key=wrapped_key,
+            watermark_payload=wm_payload,
+            watermark_payload_len=len(wm_payload.encode("utf-8")),
+            watermark_id="",  # filled in by the background embed task
+        )
+        db.session.add(media)
+        db.session.flush()  # assigns media.id; one commit covers both rows
+
+        db.session.add(AuditLog(
+            user_id=uid, action="upload",
+            media_id=media.id, result="success",
+            detail=f"api_upload size={meta['original_size']}",
+        ))
+        db.session.commit()
+    except Exception:
+        # Until the embed task is submitted, the plaintext scratch copy
+        # (tmpfs) and a partial ciphertext are this request's to clean up
+        for path in (tmp_path, stored_path):
+            if path:
+                _unlink_quiet(path)
+        raise
+
+    media_id, media_name, media_size = media.id, media.original_filename, media.file_size
+    if tmp_path:
+        tasks.submit(current_app._get_current_object(), _embed_watermark_task,
+                     media_id, tmp_path, ext, wm_payload)
 
     return jsonify({
-        "id": media.id,
-        "filename": media.original_filename,
-        "size": media.file_size,
-        "watermark_id": wm_meta.get("watermark_id", ""),
+        "id": media_id,
+        "filename": media_name,
+        "size": media_size,
+        "watermark_id": "",  # populated asynchronously; poll api_file_detail
     }), 201
 
 
@@ -724,9 +987,8 @@ def api_delete(file_id: int):
     if media.owner_id != current_user.id and not current_user.is_admin:
         return jsonify({"error": "Forbidden"}), 403
 
-    enc_path = os.path.join(current_app.config["UPLOAD_FOLDER"], media.stored_filename)
-    if os.path.isfile(enc_path):
-        os.unlink(enc_path)
+    enc_path = os.path.join(_UPLOAD_DIR, media.stored_filename)
+    tasks.submit(current_app._get_current_object(), _unlink_file_task, enc_path)
 
     media.status = "deleted"
     media.encrypted_key = None
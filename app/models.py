@@ -2,11 +2,18 @@
 
 import secrets
 from datetime import datetime, timezone, timedelta
+from argon2 import PasswordHasher
+from argon2.exceptions import InvalidHashError, VerificationError
 from flask_login import UserMixin
-from werkzeug.security import generate_password_hash, check_password_hash
+from werkzeug.security import check_password_hash
 
 from app import db, login_manager
 
+# Argon2id — cheaper per equivalent security than the Werkzeug defaults and
+# memory-hard. Legacy Werkzeug hashes are still verified (and transparently
+# upgraded) in User.check_password.
+password_hasher = PasswordHasher(time_cost=2, memory_cost=64 * 1024, parallelism=2)
+
 
 class User(UserMixin, db.Model):
     """User account (Admin or Standard)."""
@@ -19,14 +26,28 @@ class User(UserMixin, db.Model):
     role = db.Column(db.String(20), nullable=False, default="user")  # "admin" | "user"
     created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
 
-    # Relationships
-    files = db.relationship("MediaFile", backref="owner", lazy="dynamic")
+    # Relationships. Plain lazy="select" — the old lazy="dynamic" handed
+    # back a fresh Query object on every access, so each template touch
+    # re-executed SQL and eager-loader options couldn't apply. Views that
+    # only need counts aggregate in SQL instead of loading the collection.
+    files = db.relationship("MediaFile", backref="owner", lazy="select")
 
     def set_password(self, password: str) -> None:
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = password_hasher.hash(password)
 
     def check_password(self, password: str) -> bool:
-        return check_password_hash(self.password_hash, password)
+        if self.password_hash.startswith("$argon2"):
+            try:
+                return password_hasher.verify(self.password_hash, password)
+            except (VerificationError, InvalidHashError):
+                return False
+        # Legacy Werkzeug hash (pbkdf2/scrypt) — verify, then upgrade in
+        # place so the next login takes the Argon2 path. The caller's
+        # commit (e.g. the login audit log) persists the new hash.
+        if check_password_hash(self.password_hash, password):
+            self.password_hash = password_hasher.hash(password)
+            return True
+        return False
 
     @property
     def is_admin(self) -> bool:
@@ -49,13 +70,32 @@ class MediaFile(db.Model):
     status = db.Column(db.String(20), default="encrypted")  # encrypted | deleted
     created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
 
-    # Encryption metadata (Fernet-wrapped AES key stored as text)
-    encrypted_key = db.Column(db.Text, nullable=True)
+    # Encryption metadata (wrapped AES key stored as text). Deferred:
+    # only the decrypt paths read it, so list/detail queries skip the
+    # widest column on the row; download() undefers it explicitly.
+    encrypted_key = db.deferred(db.Column(db.Text, nullable=True))
+
+    # Ciphertext fingerprints, captured while the file is encrypted.
+    # Immutable once written (refreshed on watermark re-encryption), so
+    # /verify reads the row instead of re-scanning the stored file.
+    sha256_encrypted = db.Column(db.String(64), nullable=True)
+    header_hex = db.Column(db.String(64), nullable=True)   # first 32 bytes
+    entropy_bits = db.Column(db.Float, nullable=True)      # first-KiB sample
 
     # Watermark metadata (Phase 3)
     watermark_payload = db.Column(db.String(255), nullable=True)  # e.g. "user:3|ts:1707500000"
+    watermark_payload_len = db.Column(db.Integer, nullable=True)  # UTF-8 byte length, fixed at embed time
     watermark_id = db.Column(db.String(64), nullable=True)        # short hash for display
 
+    __table_args__ = (
+        # dashboard/profile/api_files filter on (owner_id, status);
+        # admin_files sorts by created_at — index both hot predicates.
+        # file_size rides along so profile's SUM(file_size) aggregate is
+        # answerable from the index alone (no heap fetch per row).
+        db.Index("ix_media_files_owner_status", "owner_id", "status", "file_size"),
+        db.Index("ix_media_files_created_at", "created_at"),
+    )
+
     def __repr__(self) -> str:
         return f"<MediaFile {self.original_filename} ({self.status})>"
 
@@ -72,6 +112,14 @@ class AuditLog(db.Model):
     detail = db.Column(db.Text, nullable=True)
     timestamp = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
 
+    __table_args__ = (
+        # profile's recent-activity list filters by user and sorts by
+        # timestamp desc — the composite index serves both in one scan
+        db.Index("ix_audit_logs_user_ts", "user_id", "timestamp"),
+        # file_detail's per-file log list (media_id=?, newest first)
+        db.Index("ix_audit_logs_media_ts", "media_id", "timestamp"),
+    )
+
     def __repr__(self) -> str:
         return f"<AuditLog {self.action} user={self.user_id}>"
 
@@ -119,8 +167,13 @@ class ShareToken(db.Model):
 
     @staticmethod
     def create(media_id: int, sender_id: int, recipient_id: int,
-               allow_download: bool = False, ttl_hours: int = 24):
-        """Create a new share token with default 24-hour expiry."""
+               allow_download: bool = False, ttl_hours: int = 24,
+               commit: bool = True):
+        """Create a new share token with default 24-hour expiry.
+
+        ``commit=False`` only flushes, so callers creating one token per
+        recipient can batch the whole share into a single commit.
+        """
         tok = ShareToken(
             token=ShareToken.generate_token(),
             media_id=media_id,
@@ -130,7 +183,10 @@ class ShareToken(db.Model):
             expires_at=datetime.now(timezone.utc) + timedelta(hours=ttl_hours),
         )
         db.session.add(tok)
-        db.session.commit()
+        if commit:
+            db.session.commit()
+        else:
+            db.session.flush()
         return tok
 
     @property
@@ -157,10 +213,11 @@ class ShareToken(db.Model):
         self.status = "used"
         db.session.commit()
 
-    def revoke(self):
+    def revoke(self, commit: bool = True):
         self.revoked_at = datetime.now(timezone.utc)
         self.status = "revoked"
-        db.session.commit()
+        if commit:
+            db.session.commit()
 
     def __repr__(self) -> str:
         return f"<ShareToken {self.token[:8]}… media={self.media_id} → user={self.recipient_id}>"
@@ -16,11 +16,16 @@ Policy Types:
   • MULTI_PARTY: Requires multiple approvals (threshold)
 """
 
+import ast
+import time
 from enum import Enum
+from functools import lru_cache
 from typing import Optional, List, Dict, Any
 from datetime import datetime, timezone
 from dataclasses import dataclass
 
+from flask import current_app
+
 from app import db
 
 
@@ -77,10 +82,6 @@ class Policy(db.Model):
     policy_type = db.Column(db.String(30), nullable=False, default=PolicyType.OWNER_ONLY.value)
     priority = db.Column(db.Integer, default=0)  # Higher = evaluated first
     
-    # Policy parameters (JSON-like storage)
-    # For SHARED: list of user IDs
-    allowed_users = db.Column(db.Text, nullable=True)  # Comma-separated user IDs
-    
     # For TIME_LIMITED: expiry timestamp
     expires_at = db.Column(db.DateTime, nullable=True)
     
@@ -94,19 +95,143 @@ class Policy(db.Model):
     created_by = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=True)
     created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
     enabled = db.Column(db.Boolean, default=True)
-    
+
+    __table_args__ = (
+        # share lookups always filter on (policy_type, enabled) — indexed
+        # so they stop scanning the whole policy table
+        db.Index("ix_policies_type_enabled", "policy_type", "enabled"),
+        # evaluate_policy's single lookup (media_id OR is_global, enabled,
+        # ordered by priority) — covered so the planner answers both
+        # predicates and the sort from index scans
+        db.Index("ix_policies_lookup", "media_id", "is_global", "enabled",
+                 "priority"),
+    )
+
     def __repr__(self):
         return f"<Policy {self.policy_type} media_id={self.media_id}>"
-    
+
     def get_allowed_users(self) -> List[int]:
-        """Parse allowed_users string into list of user IDs."""
-        if not self.allowed_users:
+        """User IDs on this policy's share list."""
+        if self.id is None:
             return []
-        return [int(x.strip()) for x in self.allowed_users.split(",") if x.strip()]
-    
+        return db.session.execute(
+            db.select(PolicyAllowedUser.user_id).filter_by(policy_id=self.id)
+        ).scalars().all()
+
     def set_allowed_users(self, user_ids: List[int]):
-        """Set allowed_users from list of user IDs."""
-        self.allowed_users = ",".join(str(uid) for uid in user_ids)
+        """Replace the share list with *user_ids* (policy must be flushed)."""
+        PolicyAllowedUser.query.filter_by(policy_id=self.id).delete(
+            synchronize_session=False)
+        db.session.add_all(
+            PolicyAllowedUser(policy_id=self.id, user_id=uid)
+            for uid in set(user_ids)
+        )
+
+
+class PolicyAllowedUser(db.Model):
+    """Share-list membership row — one (policy, user) pair per grant.
+
+    Replaces the old comma-separated ``allowed_users`` text column:
+    membership checks become a primary-key probe instead of a string
+    parse + list scan per evaluation, and revocation is a single DELETE.
+    """
+    __tablename__ = "policy_allowed_users"
+
+    policy_id = db.Column(
+        db.Integer, db.ForeignKey("policies.id", ondelete="CASCADE"),
+        primary_key=True,
+    )
+    # Separately indexed so "what is shared with this user" resolves
+    # without scanning the composite key from the policy side
+    user_id = db.Column(db.Integer, primary_key=True, index=True)
+
+    policy = db.relationship(
+        "Policy",
+        backref=db.backref("allowed_user_rows", cascade="all, delete-orphan",
+                           passive_deletes=True),
+    )
+
+    def __repr__(self):
+        return f"<PolicyAllowedUser policy={self.policy_id} user={self.user_id}>"
+
+
+# Share-style policy types — the pair every "is this file shared with me"
+# query filters on
+_SHARE_TYPES = (PolicyType.SHARED.value, PolicyType.TIME_LIMITED.value)
+
+
+def _is_allowed_user(policy_id: int, user_id: int) -> bool:
+    """Indexed membership probe against the share-list table."""
+    return db.session.execute(
+        db.select(PolicyAllowedUser.policy_id)
+        .filter_by(policy_id=policy_id, user_id=user_id).limit(1)
+    ).first() is not None
+
+
+def shared_media_ids(user_id: int) -> List[int]:
+    """IDs of files shared with *user_id* via SHARED/TIME_LIMITED policies.
+
+    One indexed join returning media_id directly — cost scales with the
+    user's share count, not the global policy count.
+    """
+    return db.session.execute(
+        db.select(Policy.media_id)
+        .join(PolicyAllowedUser, PolicyAllowedUser.policy_id == Policy.id)
+        .filter(
+            PolicyAllowedUser.user_id == user_id,
+            Policy.policy_type.in_(_SHARE_TYPES),
+            Policy.enabled == True,
+            Policy.media_id.isnot(None),
+        )
+    ).scalars().all()
+
+
+def backfill_share_lists() -> int:
+    """One-shot migration: copy legacy CSV grants into policy_allowed_users.
+
+    Databases created before the association table stored share lists in a
+    ``policies.allowed_users`` text column that the model no longer maps.
+    Run from ``flask db-init``; on schemas without the legacy column (fresh
+    installs) this is a no-op. Idempotent — existing rows are skipped.
+
+    Returns the number of grants inserted.
+    """
+    inspector = db.inspect(db.engine)
+    legacy_cols = {c["name"] for c in inspector.get_columns("policies")}
+    if "allowed_users" not in legacy_cols:
+        return 0
+
+    inserted = 0
+    rows = db.session.execute(db.text(
+        "SELECT id, allowed_users FROM policies "
+        "WHERE allowed_users IS NOT NULL AND allowed_users != ''"
+    )).all()
+    for policy_id, csv in rows:
+        existing = set(db.session.execute(
+            db.select(PolicyAllowedUser.user_id).filter_by(policy_id=policy_id)
+        ).scalars())
+        for part in csv.split(","):
+            part = part.strip()
+            if part and int(part) not in existing:
+                db.session.add(PolicyAllowedUser(policy_id=policy_id,
+                                                 user_id=int(part)))
+                inserted += 1
+    db.session.commit()
+    invalidate_policy_cache()
+    return inserted
+
+
+def share_list_user_ids(media_id: int) -> set:
+    """All user IDs listed in enabled share policies on *media_id*."""
+    return set(db.session.execute(
+        db.select(PolicyAllowedUser.user_id)
+        .join(Policy, Policy.id == PolicyAllowedUser.policy_id)
+        .filter(
+            Policy.media_id == media_id,
+            Policy.policy_type.in_(_SHARE_TYPES),
+            Policy.enabled == True,
+        )
+    ).scalars())
 
 
 class PolicyLog(db.Model):
@@ -130,6 +255,25 @@ class PolicyLog(db.Model):
 # Policy Engine Functions
 # ---------------------------------------------------------------------------
 
+# Evaluation cache — repeat access checks (scrubbing through a file,
+# API polling) re-ran the full policy query + evaluation each time even
+# though policies change rarely. Keyed on everything the decision depends
+# on; share/revoke/policy edits invalidate, and the short TTL bounds
+# staleness for TIME_LIMITED expiries.
+_EVAL_TTL_S = 60.0
+_EVAL_CACHE_MAX = 10_000
+_eval_cache: Dict[tuple, tuple] = {}  # key -> (decision, reason, policy_id, ts)
+
+
+def invalidate_policy_cache(media_id: Optional[int] = None) -> None:
+    """Drop cached evaluations for *media_id*, or everything if None."""
+    if media_id is None:
+        _eval_cache.clear()
+        return
+    for key in [k for k in _eval_cache if k[1] == media_id]:
+        _eval_cache.pop(key, None)
+
+
 def evaluate_policy(context: PolicyContext) -> tuple[AccessDecision, str, Optional[int]]:
     """
     Evaluate access policies for a given context.
@@ -144,19 +288,13 @@ def evaluate_policy(context: PolicyContext) -> tuple[AccessDecision, str, Option
     if context.user_role == "admin":
         return AccessDecision.ALLOW, "Admin has full access", None
     
-    # 2. Get file-specific policies
-    file_policies = Policy.query.filter_by(
-        media_id=context.file_id,
-        enabled=True
-    ).order_by(Policy.priority.desc()).all()
-    
-    # 3. Get global policies
-    global_policies = Policy.query.filter_by(
-        is_global=True,
-        enabled=True
-    ).order_by(Policy.priority.desc()).all()
-    
-    all_policies = file_policies + global_policies
+    # 2. Get file-specific and global policies in one round-trip. Ordering
+    #    matches the old two-query concatenation: file-specific first, then
+    #    global, each by descending priority.
+    all_policies = Policy.query.filter(
+        db.or_(Policy.media_id == context.file_id, Policy.is_global == True),
+        Policy.enabled == True,
+    ).order_by(Policy.is_global.asc(), Policy.priority.desc()).all()
     
     # 4. If no policies defined, use default (owner-only)
     if not all_policies:
@@ -176,72 +314,127 @@ def evaluate_policy(context: PolicyContext) -> tuple[AccessDecision, str, Option
     return AccessDecision.DENY, "No matching policy allowed access", None
 
 
+# Per-type policy handlers — one function per PolicyType, dispatched via
+# _HANDLERS below instead of walking an if/elif chain of enum comparisons
+# on every evaluation.
+
+def _handle_owner_only(policy: Policy, context: PolicyContext) -> tuple[AccessDecision, str]:
+    if context.user_id == context.file_owner_id:
+        return AccessDecision.ALLOW, "Owner access granted"
+    return AccessDecision.DENY, "Not the file owner"
+
+
+def _handle_admin_override(policy: Policy, context: PolicyContext) -> tuple[AccessDecision, str]:
+    if context.user_role == "admin":
+        return AccessDecision.ALLOW, "Admin override"
+    return AccessDecision.DENY, "Admin access only"
+
+
+def _handle_shared(policy: Policy, context: PolicyContext) -> tuple[AccessDecision, str]:
+    if context.user_id == context.file_owner_id or \
+            _is_allowed_user(policy.id, context.user_id):
+        return AccessDecision.ALLOW, "User in share list"
+    return AccessDecision.DENY, "User not in share list"
+
+
+def _handle_time_limited(policy: Policy, context: PolicyContext) -> tuple[AccessDecision, str]:
+    # Check if user is allowed (owner or shared)
+    if context.user_id != context.file_owner_id and \
+            not _is_allowed_user(policy.id, context.user_id):
+        return AccessDecision.DENY, "User not authorized"
+
+    # Check expiry (handle both naive and aware datetimes)
+    if policy.expires_at:
+        expires_at = policy.expires_at
+        request_time = context.request_time
+        # Make both aware or both naive for comparison
+        if expires_at.tzinfo is None and request_time.tzinfo is not None:
+            expires_at = expires_at.replace(tzinfo=timezone.utc)
+        elif expires_at.tzinfo is not None and request_time.tzinfo is None:
+            request_time = request_time.replace(tzinfo=timezone.utc)
+        if request_time > expires_at:
+            return AccessDecision.EXPIRED, "Access has expired"
+    return AccessDecision.ALLOW, "Time-limited access valid"
+
+
+def _handle_multi_party(policy: Policy, context: PolicyContext) -> tuple[AccessDecision, str]:
+    # Check if enough shares are provided
+    if len(context.provided_shares) >= policy.required_approvals:
+        return AccessDecision.ALLOW, f"Multi-party: {len(context.provided_shares)}/{policy.required_approvals} shares provided"
+    return AccessDecision.REQUIRE_SHARES, f"Need {policy.required_approvals} shares, got {len(context.provided_shares)}"
+
+
+def _handle_custom(policy: Policy, context: PolicyContext) -> tuple[AccessDecision, str]:
+    return _evaluate_custom_rule(policy.rule_expression, context)
+
+
+def _handle_unknown(policy: Policy, context: PolicyContext) -> tuple[AccessDecision, str]:
+    return AccessDecision.DENY, "Unknown policy type"
+
+
+_HANDLERS = {
+    PolicyType.OWNER_ONLY.value: _handle_owner_only,
+    PolicyType.ADMIN_OVERRIDE.value: _handle_admin_override,
+    PolicyType.SHARED.value: _handle_shared,
+    PolicyType.TIME_LIMITED.value: _handle_time_limited,
+    PolicyType.MULTI_PARTY.value: _handle_multi_party,
+    PolicyType.CUSTOM.value: _handle_custom,
+}
+
+
 def _evaluate_single_policy(policy: Policy, context: PolicyContext) -> tuple[AccessDecision, str]:
     """Evaluate a single policy against the context."""
-    
-    if policy.policy_type == PolicyType.OWNER_ONLY.value:
-        if context.user_id == context.file_owner_id:
-            return AccessDecision.ALLOW, "Owner access granted"
-        return AccessDecision.DENY, "Not the file owner"
-    
-    elif policy.policy_type == PolicyType.ADMIN_OVERRIDE.value:
-        if context.user_role == "admin":
-            return AccessDecision.ALLOW, "Admin override"
-        return AccessDecision.DENY, "Admin access only"
-    
-    elif policy.policy_type == PolicyType.SHARED.value:
-        allowed = policy.get_allowed_users()
-        if context.user_id in allowed or context.user_id == context.file_owner_id:
-            return AccessDecision.ALLOW, "User in share list"
-        return AccessDecision.DENY, "User not in share list"
-    
-    elif policy.policy_type == PolicyType.TIME_LIMITED.value:
-        # Check if user is allowed (owner or shared)
-        if context.user_id != context.file_owner_id:
-            allowed = policy.get_allowed_users()
-            if context.user_id not in allowed:
-                return AccessDecision.DENY, "User not authorized"
-        
-        # Check expiry (handle both naive and aware datetimes)
-        if policy.expires_at:
-            expires_at = policy.expires_at
-            request_time = context.request_time
-            # Make both aware or both naive for comparison
-            if expires_at.tzinfo is None and request_time.tzinfo is not None:
-                expires_at = expires_at.replace(tzinfo=timezone.utc)
-            elif expires_at.tzinfo is not None and request_time.tzinfo is None:
-                request_time = request_time.replace(tzinfo=timezone.utc)
-            if request_time > expires_at:
-                return AccessDecision.EXPIRED, "Access has expired"
-        return AccessDecision.ALLOW, "Time-limited access valid"
-    
-    elif policy.policy_type == PolicyType.MULTI_PARTY.value:
-        # Check if enough shares are provided
-        if len(context.provided_shares) >= policy.required_approvals:
-            return AccessDecision.ALLOW, f"Multi-party: {len(context.provided_shares)}/{policy.required_approvals} shares provided"
-        return AccessDecision.REQUIRE_SHARES, f"Need {policy.required_approvals} shares, got {len(context.provided_shares)}"
-    
-    elif policy.policy_type == PolicyType.CUSTOM.value:
-        # Evaluate custom rule expression (basic implementation)
-        return _evaluate_custom_rule(policy.rule_expression, context)
-    
-    return AccessDecision.DENY, "Unknown policy type"
+    return _HANDLERS.get(policy.policy_type, _handle_unknown)(policy, context)
+
+
+# Node types a custom rule may contain — names, constants, boolean logic
+# and comparisons. Anything else (calls, attributes, subscripts, …) fails
+# compilation, which is a stronger sandbox than the old character whitelist.
+_RULE_NODES = (
+    ast.Expression, ast.BoolOp, ast.UnaryOp, ast.Compare,
+    ast.Name, ast.Load, ast.Constant,
+    ast.And, ast.Or, ast.Not,
+    ast.Eq, ast.NotEq, ast.Lt, ast.Gt, ast.LtE, ast.GtE,
+)
+
+
+@lru_cache(maxsize=512)
+def _compile_rule(expression: str):
+    """Parse, validate and compile a rule expression to a code object.
+
+    Cached on the raw rule text — policies change rarely, so repeat
+    evaluations skip the parse/compile entirely. Raises SyntaxError or
+    ValueError for rules outside the whitelisted grammar.
+    """
+    tree = ast.parse(expression, mode="eval")
+    for node in ast.walk(tree):
+        if not isinstance(node, _RULE_NODES):
+            raise ValueError(f"Disallowed element in rule: {type(node).__name__}")
+    return compile(tree, "<policy>", "eval")
 
 
 def _evaluate_custom_rule(expression: str, context: PolicyContext) -> tuple[AccessDecision, str]:
     """
     Evaluate a custom rule expression.
-    
+
     Simple expression language:
-    - "user.id == 5" → check user ID
-    - "user.role == 'admin'" → check role
-    - "file.owner_id == user.id" → ownership check
+    - "user_id == 5" → check user ID
+    - "user_role == 'admin'" → check role
+    - "file_owner_id == user_id" → ownership check
     - "action == 'view'" → action check
+
+    The expression is compiled once (see _compile_rule) and then run with
+    the context variables as locals — no per-request string interpolation
+    or re-parsing.
     """
     if not expression:
         return AccessDecision.DENY, "Empty custom rule"
-    
-    # Create evaluation context
+
+    try:
+        code = _compile_rule(expression)
+    except (SyntaxError, ValueError):
+        return AccessDecision.DENY, "Invalid custom rule expression"
+
     eval_vars = {
         "user_id": context.user_id,
         "user_role": context.user_role,
@@ -251,29 +444,13 @@ def _evaluate_custom_rule(expression: str, context: PolicyContext) -> tuple[Acce
         "is_owner": context.user_id == context.file_owner_id,
         "is_admin": context.user_role == "admin",
     }
-    
+
     try:
-        # Safe evaluation of simple expressions
-        # Replace variable references
-        expr = expression
-        for var, val in eval_vars.items():
-            if isinstance(val, str):
-                expr = expr.replace(var, f"'{val}'")
-            elif isinstance(val, bool):
-                expr = expr.replace(var, str(val))
-            else:
-                expr = expr.replace(var, str(val))
-        
-        # Only allow safe operations
-        allowed_chars = set("0123456789 ==!<>&|()\"'truefalseandornot")
-        if not set(expr.lower().replace(" ", "")).issubset(allowed_chars):
-            return AccessDecision.DENY, "Invalid custom rule expression"
-        
-        result = eval(expr, {"__builtins__": {}}, {})
+        result = eval(code, {"__builtins__": {}}, eval_vars)
         if result:
             return AccessDecision.ALLOW, f"Custom rule passed: {expression}"
         return AccessDecision.DENY, f"Custom rule failed: {expression}"
-    
+
     except Exception as e:
         return AccessDecision.DENY, f"Custom rule error: {str(e)}"
 
@@ -318,13 +495,30 @@ def check_access(user_id: int, user_role: str, file_id: int,
         action=action,
         provided_shares=provided_shares or []
     )
-    
-    decision, reason, policy_id = evaluate_policy(context)
-    
-    # Log the decision
-    log_policy_decision(context, decision, reason, policy_id)
-    
+
+    # Provided key shares change the MULTI_PARTY outcome per request, so
+    # only share-less checks (the overwhelming majority) are cacheable
+    cache_key = (user_id, file_id, action, user_role, file_owner_id)
+    cached = None if provided_shares else _eval_cache.get(cache_key)
+    if cached is not None and time.monotonic() - cached[3] < _EVAL_TTL_S:
+        decision, reason, policy_id = cached[0], cached[1], cached[2]
+    else:
+        decision, reason, policy_id = evaluate_policy(context)
+        if not provided_shares:
+            if len(_eval_cache) >= _EVAL_CACHE_MAX:
+                _eval_cache.clear()
+            _eval_cache[cache_key] = (decision, reason, policy_id, time.monotonic())
+
     allowed = decision == AccessDecision.ALLOW
+
+    # Denials, expiries and share-requests — the security-interesting
+    # outcomes — are always logged. ALLOW decisions (the bulk of traffic:
+    # owners and admins touching their own files) only log when opted in,
+    # saving an INSERT + COMMIT per successful check. Combined with the
+    # cache above, a repeat allowed check does zero database work.
+    if not allowed or current_app.config.get("POLICY_LOG_ALLOW", False):
+        log_policy_decision(context, decision, reason, policy_id)
+
     return allowed, reason
 
 
@@ -332,17 +526,18 @@ def check_access(user_id: int, user_role: str, file_id: int,
 # Policy Management Functions
 # ---------------------------------------------------------------------------
 
-def create_policy(media_id: Optional[int], policy_type: PolicyType, 
-                  created_by: int, **kwargs) -> Policy:
+def create_policy(media_id: Optional[int], policy_type: PolicyType,
+                  created_by: int, commit: bool = True, **kwargs) -> Policy:
     """
     Create a new policy.
-    
+
     Args:
         media_id: File ID (None for global policy)
         policy_type: Type of policy
         created_by: User ID creating the policy
+        commit: Commit immediately (False = flush only, caller commits)
         **kwargs: Additional policy parameters
-        
+
     Returns:
         The created Policy
     """
@@ -358,11 +553,15 @@ def create_policy(media_id: Optional[int], policy_type: PolicyType,
         enabled=kwargs.get("enabled", True)
     )
     
+    db.session.add(policy)
+    db.session.flush()  # assign policy.id before share-list rows reference it
+
     if "allowed_users" in kwargs:
         policy.set_allowed_users(kwargs["allowed_users"])
-    
-    db.session.add(policy)
-    db.session.commit()
+
+    if commit:
+        db.session.commit()
+    invalidate_policy_cache(media_id)
     return policy
 
 
@@ -379,6 +578,7 @@ def update_policy(policy_id: int, **kwargs) -> Optional[Policy]:
             setattr(policy, key, value)
     
     db.session.commit()
+    invalidate_policy_cache(policy.media_id)
     return policy
 
 
@@ -388,8 +588,10 @@ def delete_policy(policy_id: int) -> bool:
     if not policy:
         return False
     
+    media_id = policy.media_id
     db.session.delete(policy)
     db.session.commit()
+    invalidate_policy_cache(media_id)
     return True
 
 
@@ -404,54 +606,63 @@ def get_global_policies() -> List[Policy]:
 
 
 def share_file(media_id: int, owner_id: int, target_user_ids: List[int],
-               expires_at: Optional[datetime] = None) -> Policy:
+               expires_at: Optional[datetime] = None, commit: bool = True) -> Policy:
     """
     Share a file with specific users.
-    
-    Creates or updates a SHARED or TIME_LIMITED policy.
+
+    Creates or updates a SHARED or TIME_LIMITED policy. With ``commit=False``
+    the change is only flushed so the caller can batch it into one commit.
     """
     policy_type = PolicyType.TIME_LIMITED if expires_at else PolicyType.SHARED
-    
+
     # Check for existing share policy
     existing = Policy.query.filter_by(
         media_id=media_id,
         policy_type=policy_type.value,
         enabled=True
     ).first()
-    
+
     if existing:
-        # Update existing policy
+        # Update existing policy — insert only the grants not already there
         current_users = set(existing.get_allowed_users())
-        current_users.update(target_user_ids)
-        existing.set_allowed_users(list(current_users))
+        db.session.add_all(
+            PolicyAllowedUser(policy_id=existing.id, user_id=uid)
+            for uid in set(target_user_ids) - current_users
+        )
         if expires_at:
             existing.expires_at = expires_at
-        db.session.commit()
+        if commit:
+            db.session.commit()
+        else:
+            db.session.flush()
+        invalidate_policy_cache(media_id)
         return existing
-    
+
     # Create new policy
+    invalidate_policy_cache(media_id)
     return create_policy(
         media_id=media_id,
         policy_type=policy_type,
         created_by=owner_id,
+        commit=commit,
         allowed_users=target_user_ids,
         expires_at=expires_at
     )
 
 
 def revoke_share(media_id: int, target_user_id: int) -> bool:
-    """Remove a user from the share list."""
-    policies = Policy.query.filter(
-        Policy.media_id == media_id,
-        Policy.policy_type.in_([PolicyType.SHARED.value, PolicyType.TIME_LIMITED.value]),
-        Policy.enabled == True
-    ).all()
-    
-    for policy in policies:
-        users = policy.get_allowed_users()
-        if target_user_id in users:
-            users.remove(target_user_id)
-            policy.set_allowed_users(users)
-    
+    """Remove a user from the share list — one DELETE, no policy loads."""
+    PolicyAllowedUser.query.filter(
+        PolicyAllowedUser.user_id == target_user_id,
+        PolicyAllowedUser.policy_id.in_(
+            db.select(Policy.id).filter(
+                Policy.media_id == media_id,
+                Policy.policy_type.in_(_SHARE_TYPES),
+                Policy.enabled == True,
+            )
+        ),
+    ).delete(synchronize_session=False)
+
     db.session.commit()
+    invalidate_policy_cache(media_id)
     return True
@@ -11,22 +11,37 @@ Endpoints:
 """
 
 import os
-import tempfile
 from datetime import datetime, timezone
 
 from flask import (
     Blueprint, render_template, redirect, url_for, flash,
-    request, current_app, send_file, abort, jsonify, Response,
+    request, current_app, abort, jsonify, Response,
 )
 from flask_login import login_required, current_user
+from sqlalchemy.orm import joinedload, selectinload, undefer
 
 from app import db, csrf
 from app.models import MediaFile, AuditLog, User, ShareToken
-from app.encryption import decrypt_file, unwrap_key, decrypt_bytes
+from app.encryption import decrypt_file_stream
 
 sharing_bp = Blueprint("sharing", __name__, url_prefix="/sharing")
 
 
+def _token_with_media(token: str, with_key: bool = False) -> ShareToken:
+    """Resolve a share token and its MediaFile in one round-trip.
+
+    Every token route needs the media row right after the token lookup, so
+    a joinedload folds both into a single JOIN query instead of two
+    sequential SELECTs. ``with_key=True`` also undefers the wrapped
+    encryption key for the decrypt routes (it's a deferred column that
+    would otherwise lazy-load on first touch).
+    """
+    load = joinedload(ShareToken.media)
+    if with_key:
+        load = load.undefer(MediaFile.encrypted_key)
+    return ShareToken.query.options(load).filter_by(token=token).first_or_404()
+
+
 # -------------------------------------------------------------------------
 # Access landing — receiver clicks the share link
 # -------------------------------------------------------------------------
@@ -34,7 +49,7 @@ sharing_bp = Blueprint("sharing", __name__, url_prefix="/sharing")
 @login_required
 def access(token: str):
     """Show the identity-verification gate for a share token."""
-    st = ShareToken.query.filter_by(token=token).first_or_404()
+    st = _token_with_media(token)
 
     # Only the intended recipient can use the token
     if st.recipient_id != current_user.id:
@@ -49,7 +64,7 @@ def access(token: str):
         flash("This share link has expired.", "warning")
         return redirect(url_for("media.dashboard"))
 
-    media = db.session.get(MediaFile, st.media_id)
+    media = st.media
     if not media or media.status != "encrypted":
         flash("The shared file is no longer available.", "warning")
         return redirect(url_for("media.dashboard"))
@@ -70,7 +85,7 @@ def access(token: str):
 @login_required
 def verify(token: str):
     """Verify receiver identity by re-entering their password."""
-    st = ShareToken.query.filter_by(token=token).first_or_404()
+    st = _token_with_media(token)
 
     if st.recipient_id != current_user.id:
         abort(403)
@@ -109,7 +124,7 @@ def verify(token: str):
 @login_required
 def stream(token: str):
     """Stream the decrypted media in-browser (no download)."""
-    st = ShareToken.query.filter_by(token=token).first_or_404()
+    st = _token_with_media(token, with_key=True)
 
     if st.recipient_id != current_user.id and not current_user.is_admin:
         abort(403)
@@ -120,25 +135,12 @@ def stream(token: str):
         flash("Token is no longer valid.", "warning")
         return redirect(url_for("media.dashboard"))
 
-    media = db.session.get(MediaFile, st.media_id)
+    media = st.media
     if not media or media.status != "encrypted":
         abort(404)
 
-    enc_path = os.path.join(current_app.config["UPLOAD_FOLDER"], media.stored_filename)
-    if not os.path.isfile(enc_path):
-        abort(404)
-
-    # Decrypt to temp file
-    tmp_fd, tmp_path = tempfile.mkstemp(suffix=f"_{media.original_filename}")
-    try:
-        os.close(tmp_fd)
-        decrypt_file(enc_path, tmp_path, media.encrypted_key)
-    except Exception:
-        if os.path.exists(tmp_path):
-            os.unlink(tmp_path)
-        flash("Decryption failed.", "danger")
-        return redirect(url_for("sharing.access", token=token))
-
+    # No decryption here — this endpoint only renders the player page;
+    # the actual bytes are streamed on demand by stream_data below
     st.mark_used()
 
     db.session.add(AuditLog(
@@ -159,7 +161,7 @@ def stream(token: str):
 @login_required
 def stream_data(token: str):
     """Serve the actual decrypted bytes for the HTML5 player."""
-    st = ShareToken.query.filter_by(token=token).first_or_404()
+    st = _token_with_media(token, with_key=True)
 
     if st.recipient_id != current_user.id and not current_user.is_admin:
         abort(403)
@@ -168,27 +170,35 @@ def stream_data(token: str):
     if not st.is_valid:
         abort(403)
 
-    media = db.session.get(MediaFile, st.media_id)
+    media = st.media
     if not media or media.status != "encrypted":
         abort(404)
 
     enc_path = os.path.join(current_app.config["UPLOAD_FOLDER"], media.stored_filename)
-    if not os.path.isfile(enc_path):
-        abort(404)
 
-    # Decrypt in memory
+    # Stream decrypted chunks to the player — memory stays O(chunk) instead
+    # of holding ciphertext + plaintext of the whole file at once, and the
+    # first bytes ship after one chunk rather than after a full decrypt.
+    # GCM verifies its tag before the final chunk is released, so a
+    # tampered file aborts the transfer instead of completing it.
     try:
-        file_key = unwrap_key(media.encrypted_key)
-        with open(enc_path, "rb") as f:
-            blob = f.read()
-        plaintext = decrypt_bytes(blob, file_key)
+        stream = decrypt_file_stream(enc_path, media.encrypted_key)
+        first = next(stream, b"")  # surface missing-file/key errors early
+    except FileNotFoundError:
+        abort(404)
     except Exception:
         abort(500)
 
+    def generate():
+        yield first
+        yield from stream
+
     mime = media.mime_type or "application/octet-stream"
-    return Response(plaintext, mimetype=mime, headers={
+    return Response(generate(), mimetype=mime, headers={
         "Content-Disposition": "inline",
         "Cache-Control": "no-store, no-cache, must-revalidate, max-age=0",
+        # stored layout is nonce (12) || ciphertext || tag (16)
+        "Content-Length": str(os.path.getsize(enc_path) - 28),
     })
 
 
@@ -199,7 +209,7 @@ def stream_data(token: str):
 @login_required
 def download(token: str):
     """Download the decrypted file if policy allows."""
-    st = ShareToken.query.filter_by(token=token).first_or_404()
+    st = _token_with_media(token, with_key=True)
 
     if st.recipient_id != current_user.id and not current_user.is_admin:
         abort(403)
@@ -220,21 +230,20 @@ def download(token: str):
         flash("Download is not allowed for this share. Stream-only access.", "warning")
         return redirect(url_for("sharing.access", token=token))
 
-    media = db.session.get(MediaFile, st.media_id)
+    media = st.media
     if not media or media.status != "encrypted":
         abort(404)
 
     enc_path = os.path.join(current_app.config["UPLOAD_FOLDER"], media.stored_filename)
-    if not os.path.isfile(enc_path):
-        abort(404)
 
-    tmp_fd, tmp_path = tempfile.mkstemp(suffix=f"_{media.original_filename}")
+    # Stream decrypted chunks straight to the client — no plaintext temp
+    # file, no second read pass, constant memory (see media.download)
     try:
-        os.close(tmp_fd)
-        decrypt_file(enc_path, tmp_path, media.encrypted_key)
+        stream = decrypt_file_stream(enc_path, media.encrypted_key)
+        first = next(stream, b"")  # surface missing-file/key errors early
+    except FileNotFoundError:
+        abort(404)
     except Exception:
-        if os.path.exists(tmp_path):
-            os.unlink(tmp_path)
         flash("Decryption failed.", "danger")
         return redirect(url_for("sharing.access", token=token))
 
@@ -247,7 +256,19 @@ def download(token: str):
     ))
     db.session.commit()
 
-    return send_file(tmp_path, as_attachment=True, download_name=media.original_filename)
+    def generate():
+        yield first
+        yield from stream
+
+    return Response(
+        generate(),
+        mimetype=media.mime_type or "application/octet-stream",
+        headers={
+            "Content-Disposition": f'attachment; filename="{media.original_filename}"',
+            # stored layout is nonce (12) || ciphertext || tag (16)
+            "Content-Length": str(os.path.getsize(enc_path) - 28),
+        },
+    )
 
 
 # -------------------------------------------------------------------------
@@ -257,7 +278,7 @@ def download(token: str):
 @login_required
 def revoke_token(token: str):
     """Revoke a share token."""
-    st = ShareToken.query.filter_by(token=token).first_or_404()
+    st = _token_with_media(token)
 
     if st.sender_id != current_user.id and not current_user.is_admin:
         abort(403)
@@ -282,7 +303,11 @@ def revoke_token(token: str):
 @login_required
 def received():
     """View all share tokens the current user has received."""
-    tokens = ShareToken.query.filter_by(recipient_id=current_user.id)\
+    # The template renders t.media and t.sender per row — eager-load both
+    # with IN-queries so the list costs 3 queries total instead of 1 + 2N
+    tokens = ShareToken.query.options(
+        selectinload(ShareToken.media), selectinload(ShareToken.sender),
+    ).filter_by(recipient_id=current_user.id)\
         .order_by(ShareToken.created_at.desc()).all()
     return render_template("sharing/received.html", tokens=tokens)
 
@@ -294,6 +319,9 @@ def received():
 @login_required
 def sent():
     """View all share tokens the current user has sent."""
-    tokens = ShareToken.query.filter_by(sender_id=current_user.id)\
+    # sent.html renders t.media and t.recipient per row (see received())
+    tokens = ShareToken.query.options(
+        selectinload(ShareToken.media), selectinload(ShareToken.recipient),
+    ).filter_by(sender_id=current_user.id)\
         .order_by(ShareToken.created_at.desc()).all()
     return render_template("sharing/sent.html", tokens=tokens)
@@ -0,0 +1,47 @@
+"""In-process background task runner for watermark work.
+
+A broker-backed queue (Celery/RQ) would add a Redis deployment plus worker
+processes for what is, today, a single CPU-heavy job class. A small
+ThreadPoolExecutor gets the same user-visible win — the request thread
+returns as soon as the ciphertext is on disk — and the watermark internals
+(numpy / ffmpeg / pydub) release the GIL for most of their runtime anyway.
+
+Tasks receive the concrete app object and push their own app context, so
+they own a fresh DB session and never touch request state. Set
+``MEDIA_TASKS_EAGER`` (defaults to ``TESTING``) to run tasks inline,
+mirroring Celery's ``task_always_eager`` for deterministic tests.
+"""
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+# Created lazily so merely importing the module (CLI, scripts) spawns no
+# threads, and pre-fork servers don't duplicate a warm pool into workers.
+_executor: Optional[ThreadPoolExecutor] = None
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        # Sized to the machine: the pool carries GIL-releasing media work
+        # plus cheap cleanup jobs, so a couple of threads per core is
+        # plenty; the cap keeps small containers from overcommitting.
+        _executor = ThreadPoolExecutor(
+            max_workers=min(8, 2 * (os.cpu_count() or 1)),
+            thread_name_prefix="media-task",
+        )
+    return _executor
+
+
+def submit(app, fn, *args, **kwargs):
+    """Schedule ``fn(app, *args, **kwargs)`` on a worker thread.
+
+    In eager mode the task runs inline and its exceptions propagate; in
+    normal mode a Future is returned and failures are logged by the task
+    itself (callers never block on it).
+    """
+    if app.config.get("MEDIA_TASKS_EAGER", app.config.get("TESTING", False)):
+        fn(app, *args, **kwargs)
+        return None
+    return _get_executor().submit(fn, app, *args, **kwargs)
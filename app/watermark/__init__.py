@@ -6,8 +6,9 @@ Provides a unified API used by the media upload/download pipeline:
     extract_watermark(file_path, media_type, payload_length) -> dict
 """
 
-from app.watermark.audio import embed_audio_watermark, extract_audio_watermark
-from app.watermark.video import embed_video_watermark, extract_video_watermark
+# NOTE: the audio/video submodules pull in numpy, scipy and OpenCV — several
+# hundred ms of import time per Gunicorn worker. They are imported lazily so
+# that workers which never touch the watermark path skip the cost entirely.
 
 __all__ = [
     "embed_watermark",
@@ -21,6 +22,22 @@ __all__ = [
 AUDIO_EXTENSIONS = {"mp3", "wav", "ogg", "flac", "aac"}
 VIDEO_EXTENSIONS = {"mp4", "avi", "mkv", "mov", "webm"}
 
+_LAZY_EXPORTS = {
+    "embed_audio_watermark": "app.watermark.audio",
+    "extract_audio_watermark": "app.watermark.audio",
+    "embed_video_watermark": "app.watermark.video",
+    "extract_video_watermark": "app.watermark.video",
+}
+
+
+def __getattr__(name: str):
+    """PEP 562 lazy re-exports — defer numpy/cv2 imports to first use."""
+    module_name = _LAZY_EXPORTS.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    import importlib
+    return getattr(importlib.import_module(module_name), name)
+
 
 def _detect_media_type(filepath: str) -> str:
     ext = filepath.rsplit(".", 1)[-1].lower()
@@ -33,21 +50,32 @@ def _detect_media_type(filepath: str) -> str:
 
 def embed_watermark(
     src_path: str,
-    dst_path: str,
+    dst,
     payload: str,
     media_type: str | None = None,
+    step_size: int | None = None,
 ) -> dict:
     """Embed an invisible watermark carrying *payload* (e.g. user-ID + timestamp).
 
+    For audio, *dst* may be a seekable binary file-like instead of a path —
+    the watermarked WAV is written straight into it. Video output must be a
+    path (cv2.VideoWriter requires a real file). *step_size* tunes the video
+    embed's temporal delta propagation (ignored for audio); None keeps the
+    module default.
+
     Returns a metadata dict with keys like ``watermark_id``, ``snr_db``, etc.
     """
     if media_type is None:
         media_type = _detect_media_type(src_path)
 
     if media_type == "audio":
-        return embed_audio_watermark(src_path, dst_path, payload)
+        from app.watermark.audio import embed_audio_watermark
+        return embed_audio_watermark(src_path, dst, payload)
     elif media_type == "video":
-        return embed_video_watermark(src_path, dst_path, payload)
+        from app.watermark.video import embed_video_watermark
+        if step_size is not None:
+            return embed_video_watermark(src_path, dst, payload, step_size=step_size)
+        return embed_video_watermark(src_path, dst, payload)
     else:
         raise ValueError(f"Unknown media type: {media_type}")
 
@@ -56,17 +84,25 @@ def extract_watermark(
     filepath: str,
     payload_length: int,
     media_type: str | None = None,
+    n_frames: int | None = None,
 ) -> dict:
     """Extract the watermark payload from a watermarked file.
 
+    *n_frames* caps how many key-frames the video extractor inspects
+    (ignored for audio); None keeps the module default.
+
     Returns dict with ``payload``, ``match`` (bool), ``bit_error_rate``, etc.
     """
     if media_type is None:
         media_type = _detect_media_type(filepath)
 
     if media_type == "audio":
+        from app.watermark.audio import extract_audio_watermark
         return extract_audio_watermark(filepath, payload_length)
     elif media_type == "video":
+        from app.watermark.video import extract_video_watermark
+        if n_frames is not None:
+            return extract_video_watermark(filepath, payload_length, n_frames=n_frames)
         return extract_video_watermark(filepath, payload_length)
     else:
         raise ValueError(f"Unknown media type: {media_type}")
@@ -20,6 +20,7 @@ import struct
 import wave
 import tempfile
 import os
+from functools import lru_cache
 from typing import Tuple
 
 import numpy as np
@@ -57,10 +58,23 @@ def _bits_to_str(bits: list[int]) -> str:
 
 
 def _pn_sequence(bit_index: int, length: int) -> np.ndarray:
-    """Deterministic ±1 PN sequence for a given bit position."""
+    """Deterministic ±1 PN sequence for a given bit position.
+
+    float32 throughout the embed/extract path: detection is a sign test on
+    a 512-sample correlation, so single precision loses nothing while
+    halving memory traffic and doubling SIMD lanes per op.
+    """
     seed = hashlib.sha256(_SECRET + struct.pack(">I", bit_index)).digest()
     rng = np.random.RandomState(int.from_bytes(seed[:4], "big"))
-    return rng.choice([-1, 1], size=length).astype(np.float64)
+    return rng.choice([-1, 1], size=length).astype(np.float32)
+
+
+@lru_cache(maxsize=8)
+def _pn_matrix(n_bits: int, length: int) -> np.ndarray:
+    """Rows 0..n_bits-1 of _pn_sequence stacked into one (n_bits, length)
+    matrix, cached — payload lengths are near-constant in practice, so
+    embed and extract both stop regenerating sequences per call."""
+    return np.stack([_pn_sequence(i, length) for i in range(n_bits)])
 
 
 def _read_wav(path: str) -> Tuple[np.ndarray, int, int]:
@@ -79,15 +93,17 @@ def _read_wav(path: str) -> Tuple[np.ndarray, int, int]:
     else:
         dtype = np.int16  # fallback
 
-    samples = np.frombuffer(raw, dtype=dtype).astype(np.float64)
+    samples = np.frombuffer(raw, dtype=dtype).astype(np.float32)
     if n_channels > 1:
         samples = samples.reshape(-1, n_channels)[:, 0]  # mono mix (first channel)
     return samples, rate, n_channels
 
 
-def _write_wav(path: str, samples: np.ndarray, rate: int, sampwidth: int = 2) -> None:
+def _write_wav(dst, samples: np.ndarray, rate: int, sampwidth: int = 2) -> None:
+    """Write mono 16-bit WAV to *dst* — a path or a seekable file-like
+    (wave patches the header in place, so the object must support seek)."""
     samples_int = np.clip(samples, -32768, 32767).astype(np.int16)
-    with wave.open(path, "wb") as wf:
+    with wave.open(dst, "wb") as wf:
         wf.setnchannels(1)
         wf.setsampwidth(sampwidth)
         wf.setframerate(rate)
@@ -109,8 +125,9 @@ def _to_wav(src: str) -> Tuple[str, bool]:
 def _snr(original: np.ndarray, watermarked: np.ndarray) -> float:
     """Signal-to-Noise Ratio in dB."""
     noise = watermarked - original
-    sig_power = np.mean(original ** 2)
-    noise_power = np.mean(noise ** 2)
+    # float64 accumulators — float32 means drift on long signals
+    sig_power = np.mean(original ** 2, dtype=np.float64)
+    noise_power = np.mean(noise ** 2, dtype=np.float64)
     if noise_power == 0:
         return float("inf")
     return 10 * np.log10(sig_power / noise_power)
@@ -118,8 +135,13 @@ def _snr(original: np.ndarray, watermarked: np.ndarray) -> float:
 
 # ---- public API -----------------------------------------------------------
 
-def embed_audio_watermark(src_path: str, dst_path: str, payload: str) -> dict:
-    """Embed *payload* via time-domain spread-spectrum watermarking."""
+def embed_audio_watermark(src_path: str, dst, payload: str) -> dict:
+    """Embed *payload* via time-domain spread-spectrum watermarking.
+
+    *dst* may be a path or a seekable binary file-like — callers that
+    re-encrypt the output immediately can hand in a BytesIO and skip the
+    intermediate plaintext file entirely.
+    """
     wav_path, converted = _to_wav(src_path)
     try:
         samples, rate, _ = _read_wav(wav_path)
@@ -135,16 +157,18 @@ def embed_audio_watermark(src_path: str, dst_path: str, payload: str) -> dict:
         raise ValueError("Audio too short for this payload length.")
     
     watermarked = samples.copy()
-    
-    for i, bit in enumerate(bits):
-        start = i * _CHIP_LENGTH
-        end = start + _CHIP_LENGTH
-        pn = _pn_sequence(i, _CHIP_LENGTH)
-        symbol = 1.0 if bit else -1.0
-        watermarked[start:end] += _ALPHA * symbol * pn * np.abs(samples[start:end])
-    
+
+    # Chips are disjoint _CHIP_LENGTH blocks, so the whole embed collapses
+    # to one batched operation over an (n_bits, chip) view — identical math
+    # to the old per-bit Python loop, minus the loop
+    span = n_bits * _CHIP_LENGTH
+    region = samples[:span].reshape(n_bits, _CHIP_LENGTH)
+    symbols = np.where(np.asarray(bits, dtype=bool), 1.0, -1.0).astype(np.float32)[:, None]
+    watermarked[:span].reshape(n_bits, _CHIP_LENGTH)[:] += \
+        _ALPHA * symbols * _pn_matrix(n_bits, _CHIP_LENGTH) * np.abs(region)
+
     snr_val = _snr(samples, watermarked)
-    _write_wav(dst_path, watermarked, rate)
+    _write_wav(dst, watermarked, rate)
 
     return {
         "watermark_id": hashlib.sha256(payload.encode()).hexdigest()[:16],
@@ -167,18 +191,16 @@ def extract_audio_watermark(filepath: str, payload_length: int) -> dict:
             os.unlink(wav_path)
 
     n_bits = payload_length * 8
-    
-    extracted_bits: list[int] = []
-    for i in range(n_bits):
-        start = i * _CHIP_LENGTH
-        end = start + _CHIP_LENGTH
-        if end > len(samples):
-            extracted_bits.append(0)
-            continue
-        pn = _pn_sequence(i, _CHIP_LENGTH)
-        segment = samples[start:end]
-        correlation = np.dot(segment, pn)
-        extracted_bits.append(1 if correlation > 0 else 0)
+
+    # Row-wise correlation of every chip against its PN sequence in one
+    # einsum; bits whose chip runs past the end decode as 0, as before
+    usable = min(n_bits, len(samples) // _CHIP_LENGTH)
+    corr = np.einsum(
+        "ij,ij->i",
+        samples[:usable * _CHIP_LENGTH].reshape(usable, _CHIP_LENGTH),
+        _pn_matrix(n_bits, _CHIP_LENGTH)[:usable],
+    )
+    extracted_bits = (corr > 0).astype(int).tolist() + [0] * (n_bits - usable)
 
     recovered = _bits_to_str(extracted_bits)
 
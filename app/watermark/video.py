@@ -29,6 +29,7 @@ import cv2
 _ALPHA = 0.02           # watermark strength per DWT coefficient
 _SECRET = b"SecureMedia-VWM-2026"
 _KEYFRAME_INTERVAL = 30  # embed in every Nth frame
+_STEP_SIZE = 4           # propagate each key-frame's delta to this many frames
 
 
 # ---- helpers --------------------------------------------------------------
@@ -56,14 +57,14 @@ def _bits_to_str(bits: list[int]) -> str:
 def _pn_sequence(bit_index: int, length: int) -> np.ndarray:
     seed = hashlib.sha256(_SECRET + struct.pack(">I", bit_index)).digest()
     rng = np.random.RandomState(int.from_bytes(seed[:4], "big"))
-    return rng.choice([-1, 1], size=length).astype(np.float64)
+    return rng.choice([-1, 1], size=length).astype(np.float32)
 
 
 def _haar_dwt2(img: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
     """Simple 2-D Haar DWT → (LL, LH, HL, HH)."""
     h, w = img.shape[:2]
     h2, w2 = h // 2, w // 2
-    img = img[:h2 * 2, :w2 * 2].astype(np.float64)
+    img = img[:h2 * 2, :w2 * 2].astype(np.float32)
 
     # Row-wise
     low = (img[:, 0::2] + img[:, 1::2]) / 2.0
@@ -86,16 +87,16 @@ def _haar_idwt2(LL: np.ndarray, LH: np.ndarray, HL: np.ndarray, HH: np.ndarray)
     h, w = h2 * 2, w2 * 2
 
     # Reconstruct low and high from columns
-    low = np.zeros((h, w2), dtype=np.float64)
+    low = np.zeros((h, w2), dtype=np.float32)
     low[0::2, :] = (LL + LH)
     low[1::2, :] = (LL - LH)
 
-    high = np.zeros((h, w2), dtype=np.float64)
+    high = np.zeros((h, w2), dtype=np.float32)
     high[0::2, :] = (HL + HH)
     high[1::2, :] = (HL - HH)
 
     # Reconstruct from rows
-    img = np.zeros((h, w), dtype=np.float64)
+    img = np.zeros((h, w), dtype=np.float32)
     img[:, 0::2] = (low + high)
     img[:, 1::2] = (low - high)
 
@@ -104,29 +105,36 @@ def _haar_idwt2(LL: np.ndarray, LH: np.ndarray, HL: np.ndarray, HH: np.ndarray)
 
 def _embed_bits_in_ll(ll: np.ndarray, bits: list[int]) -> np.ndarray:
     """Spread-spectrum embed bits into the LL sub-band (CDMA full-band)."""
-    flat = ll.flatten().copy()
+    flat = ll.flatten()
     n = len(flat)
-    
+
     if n < len(bits):
         raise ValueError("LL sub-band too small for payload")
-    
-    mag = np.abs(flat)
+
+    # Sum the ±PN carriers first, then apply the magnitude scaling in one
+    # fused pass — same result as scaling per bit (the additions commute),
+    # but two full-band multiplies fewer per bit
+    carrier = np.zeros(n, dtype=np.float32)
     for i, bit in enumerate(bits):
-        pn = _pn_sequence(i, n)
-        symbol = 1.0 if bit else -1.0
-        flat += _ALPHA * symbol * pn * mag
-    
+        if bit:
+            carrier += _pn_sequence(i, n)
+        else:
+            carrier -= _pn_sequence(i, n)
+    flat += _ALPHA * carrier * np.abs(flat)
+
     return flat.reshape(ll.shape)
 
 
 def _extract_bits_from_ll(ll: np.ndarray, n_bits: int) -> list[int]:
-    flat = ll.flatten()
+    flat = ll.ravel()
     n = len(flat)
-    bits = []
-    for i in range(n_bits):
-        pn = _pn_sequence(i, n)
-        corr = np.dot(flat, pn)
-        bits.append(1 if corr > 0 else 0)
+    # Correlate against the PN carriers in chunked matrix-vector products —
+    # BLAS does the dots, and memory stays bounded for large sub-bands
+    bits: list[int] = []
+    for start in range(0, n_bits, 32):
+        pn = np.stack([_pn_sequence(i, n)
+                       for i in range(start, min(start + 32, n_bits))])
+        bits.extend((pn @ flat > 0).astype(int).tolist())
     return bits
 
 
@@ -139,9 +147,16 @@ def _psnr(original: np.ndarray, modified: np.ndarray) -> float:
 
 # ---- public API -----------------------------------------------------------
 
-def embed_video_watermark(src_path: str, dst_path: str, payload: str) -> dict:
+def embed_video_watermark(src_path: str, dst_path: str, payload: str,
+                          step_size: int = _STEP_SIZE) -> dict:
     """Embed *payload* into video frames via DWT spread-spectrum.
 
+    The full DWT + PN embed runs only on key-frames; the resulting pixel
+    delta is then copy-propagated (a single add) onto the following
+    *step_size* − 1 frames. Temporally adjacent frames are near-identical,
+    so the propagated mark survives there too — step_size× the marked
+    frames for none of the transform cost.
+
     Writes watermarked video to *dst_path*.
     Returns metadata dict.
     """
@@ -159,6 +174,9 @@ def embed_video_watermark(src_path: str, dst_path: str, payload: str) -> dict:
     out = cv2.VideoWriter(dst_path, fourcc, fps, (width, height))
     frame_idx = 0
     psnr_values = []
+    frames_propagated = 0
+    delta = None        # cached key-frame watermark distortion (int16)
+    delta_ttl = 0       # frames the cached delta is still propagated to
 
     while True:
         ret, frame = cap.read()
@@ -167,7 +185,7 @@ def embed_video_watermark(src_path: str, dst_path: str, payload: str) -> dict:
 
         if frame_idx % _KEYFRAME_INTERVAL == 0:
             # Convert to grayscale for DWT, embed, merge back
-            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY).astype(np.float64)
+            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY).astype(np.float32)
             LL, LH, HL, HH = _haar_dwt2(gray)
 
             if LL.size >= len(bits):
@@ -175,7 +193,7 @@ def embed_video_watermark(src_path: str, dst_path: str, payload: str) -> dict:
                 wm_gray = _haar_idwt2(LL_wm, LH, HL, HH)
 
                 # Blend watermark into luminance channel (YCrCb)
-                ycrcb = cv2.cvtColor(frame, cv2.COLOR_BGR2YCrCb).astype(np.float64)
+                ycrcb = cv2.cvtColor(frame, cv2.COLOR_BGR2YCrCb).astype(np.float32)
                 orig_y = ycrcb[:, :, 0].copy()
 
                 # Resize wm_gray to match (DWT may truncate odd dimensions)
@@ -185,7 +203,15 @@ def embed_video_watermark(src_path: str, dst_path: str, payload: str) -> dict:
 
                 frame_out = cv2.cvtColor(ycrcb.astype(np.uint8), cv2.COLOR_YCrCb2BGR)
                 psnr_values.append(_psnr(frame, frame_out))
+                delta = frame_out.astype(np.int16) - frame.astype(np.int16)
+                delta_ttl = max(step_size - 1, 0)
                 frame = frame_out
+        elif delta_ttl > 0 and delta is not None and delta.shape == frame.shape:
+            # Copy-propagate the key-frame distortion: one add per frame
+            # instead of DWT + per-bit PN correlation
+            frame = np.clip(frame.astype(np.int16) + delta, 0, 255).astype(np.uint8)
+            delta_ttl -= 1
+            frames_propagated += 1
 
         out.write(frame)
         frame_idx += 1
@@ -198,16 +224,24 @@ def embed_video_watermark(src_path: str, dst_path: str, payload: str) -> dict:
         "watermark_id": hashlib.sha256(payload.encode()).hexdigest()[:16],
         "payload_bits": len(bits),
         "frames_watermarked": len(psnr_values),
+        "frames_propagated": frames_propagated,
         "total_frames": frame_idx,
         "avg_psnr_db": round(avg_psnr, 2),
         "method": "dwt-spread-spectrum",
     }
 
 
-def extract_video_watermark(filepath: str, payload_length: int) -> dict:
+def extract_video_watermark(filepath: str, payload_length: int,
+                            n_frames: int = 32) -> dict:
     """Extract watermark from key-frames via DWT correlation + majority vote.
 
     *payload_length*: number of **bytes** in original payload.
+
+    *n_frames* caps how many key-frames are inspected. Every marked frame
+    carries the full payload, so the vote converges with a modest sample —
+    long videos seek to at most *n_frames* evenly spaced key-frames instead
+    of decoding every frame sequentially, making extraction O(n_frames)
+    rather than O(video length). 0 disables the cap.
     """
     n_bits = payload_length * 8
 
@@ -215,26 +249,46 @@ def extract_video_watermark(filepath: str, payload_length: int) -> dict:
     if not cap.isOpened():
         raise IOError(f"Cannot open video: {filepath}")
 
-    frame_idx = 0
-    vote_sums = np.zeros(n_bits, dtype=np.float64)
+    vote_sums = np.zeros(n_bits, dtype=np.float32)
     n_votes = 0
 
-    while True:
-        ret, frame = cap.read()
-        if not ret:
-            break
-
-        if frame_idx % _KEYFRAME_INTERVAL == 0:
-            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY).astype(np.float64)
-            LL, _, _, _ = _haar_dwt2(gray)
-
-            if LL.size >= n_bits:
-                bits = _extract_bits_from_ll(LL, n_bits)
-                # convert 0/1 → -1/+1 for voting
-                vote_sums += np.array([1 if b else -1 for b in bits], dtype=np.float64)
-                n_votes += 1
-
-        frame_idx += 1
+    total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    # Key-frame positions the embedder marked (idx % interval == 0),
+    # thinned to an evenly spaced subset when over the cap. Falls back to
+    # a sequential scan if the container doesn't report a frame count.
+    keyframes = None
+    if total > 0:
+        keyframes = np.arange(0, total, _KEYFRAME_INTERVAL)
+        if n_frames and len(keyframes) > n_frames:
+            picks = np.linspace(0, len(keyframes) - 1, n_frames).astype(int)
+            keyframes = keyframes[picks]
+
+    def _vote(frame) -> None:
+        nonlocal vote_sums, n_votes
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY).astype(np.float32)
+        LL, _, _, _ = _haar_dwt2(gray)
+        if LL.size >= n_bits:
+            bits = _extract_bits_from_ll(LL, n_bits)
+            # convert 0/1 → -1/+1 for voting
+            vote_sums += np.where(np.asarray(bits, dtype=bool), 1.0, -1.0)
+            n_votes += 1
+
+    if keyframes is not None:
+        for kf in keyframes:
+            cap.set(cv2.CAP_PROP_POS_FRAMES, int(kf))
+            ret, frame = cap.read()
+            if not ret:
+                break
+            _vote(frame)
+    else:
+        frame_idx = 0
+        while True:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            if frame_idx % _KEYFRAME_INTERVAL == 0:
+                _vote(frame)
+            frame_idx += 1
 
     cap.release()
 
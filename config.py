@@ -19,6 +19,38 @@ class Config:
         "mp4", "avi", "mkv", "mov", "webm",    # video
     }
 
+    # Plaintext scratch files (pre-encryption temp copies, decrypted
+    # downloads) live on tmpfs when available so they never touch
+    # persistent disk; None falls back to the platform temp dir.
+    PLAINTEXT_SCRATCH_DIR = os.environ.get(
+        "PLAINTEXT_SCRATCH_DIR",
+        "/dev/shm" if os.path.isdir("/dev/shm") else None,
+    )
+
+    # Policy-decision logging: denies/expiries/share-requests are always
+    # written, but logging every ALLOW costs an INSERT + COMMIT per
+    # successful access check (one per decrypt/stream/download). Opt in
+    # when a complete allow trail is required.
+    POLICY_LOG_ALLOW = os.environ.get("POLICY_LOG_ALLOW", "").lower() in ("1", "true", "yes")
+
+    # Video watermark temporal step: the DWT embed runs on key-frames and
+    # its pixel delta is copy-propagated onto the next step-1 frames, so
+    # raising this trades marked-frame density for embed throughput.
+    WATERMARK_VIDEO_STEP = int(os.environ.get("WATERMARK_VIDEO_STEP", 4))
+
+    # Video watermark extraction inspects at most this many evenly spaced
+    # key-frames (every marked frame carries the full payload, so the
+    # majority vote converges with a small sample); 0 scans them all.
+    WM_EXTRACT_FRAMES = int(os.environ.get("WM_EXTRACT_FRAMES", 32))
+
+    # Response compression (flask-compress) — brotli preferred, gzip
+    # fallback. Media payloads are already-compressed binaries, so only
+    # text/JSON mimetypes are worth the CPU.
+    COMPRESS_ALGORITHM = ["br", "gzip"]
+    COMPRESS_LEVEL = 6
+    COMPRESS_BR_LEVEL = 5
+    COMPRESS_MIN_SIZE = 500
+
 
 class DevelopmentConfig(Config):
     DEBUG = True
@@ -33,6 +65,10 @@ class TestingConfig(Config):
 class ProductionConfig(Config):
     DEBUG = False
 
+    # Schema is created once at deploy time via `flask db-init`, not by
+    # every Gunicorn worker at fork.
+    AUTO_CREATE_TABLES = False
+
     # Security hardening
     SESSION_COOKIE_SECURE = True        # cookies only over HTTPS
     SESSION_COOKIE_HTTPONLY = True       # no JS access to session cookie
@@ -42,3 +78,18 @@ class ProductionConfig(Config):
 
     # Trust proxy headers from Nginx
     PREFERRED_URL_SCHEME = "https"
+
+    # Hand file responses to the front proxy: send_file emits an
+    # X-Sendfile header and nginx/Apache does a zero-copy sendfile(2)
+    # from disk to socket instead of pumping bytes through Python.
+    # Requires the proxy to be configured for it (mod_xsendfile, or
+    # X-Accel-Redirect mapping under nginx) — hence opt-in via env.
+    USE_X_SENDFILE = os.environ.get("USE_X_SENDFILE", "").lower() in ("1", "true", "yes")
+
+    # Ciphertext downloads via nginx: when set (e.g. "/_storage"),
+    # download_encrypted answers with an X-Accel-Redirect header and nginx
+    # streams the file from its internal location using zero-copy
+    # sendfile(2) — the app worker is freed immediately. Requires the
+    # matching `location` block in nginx/nginx.conf and the storage volume
+    # mounted into the nginx container.
+    X_ACCEL_STORAGE_URI = os.environ.get("X_ACCEL_STORAGE_URI")
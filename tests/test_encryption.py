@@ -7,6 +7,9 @@ import pytest
 # Set a stable Fernet master key before importing encryption module
 os.environ["FERNET_MASTER_KEY"] = "t2JVH7Bj3GkX6vN8QfW0MpYrA5z1LcDs9iUoEhKlRxw="
 
+from cryptography.exceptions import InvalidTag
+from cryptography.fernet import Fernet
+
 from app.encryption import (
     generate_file_key,
     wrap_key,
@@ -15,6 +18,7 @@ from app.encryption import (
     decrypt_bytes,
     encrypt_file,
     decrypt_file,
+    decrypt_file_stream,
 )
 
 
@@ -30,6 +34,19 @@ class TestKeyHelpers:
         recovered = unwrap_key(wrapped)
         assert recovered == key
 
+    def test_wrap_key_emits_versioned_token(self):
+        """New tokens carry the kw1: prefix that routes them to GCM-SIV."""
+        wrapped = wrap_key(generate_file_key())
+        assert wrapped.startswith("kw1:")
+
+    def test_unwrap_legacy_fernet_token(self):
+        """Tokens wrapped before the kw1: format (plain Fernet, as stored
+        in existing DBs) still unwrap via the fallback path."""
+        key = generate_file_key()
+        legacy = Fernet(os.environ["FERNET_MASTER_KEY"].encode()).encrypt(key).decode()
+        assert not legacy.startswith("kw1:")
+        assert unwrap_key(legacy) == key
+
 
 class TestEncryptDecryptBytes:
     def test_roundtrip_small(self):
@@ -92,3 +109,43 @@ class TestEncryptDecryptFile:
         wrapped_key, meta = encrypt_file(str(src), str(enc))
         decrypt_file(str(enc), str(dec), wrapped_key)
         assert dec.read_bytes() == b""
+
+
+class TestDecryptFileStream:
+    def test_stream_roundtrip(self, tmp_path):
+        src = tmp_path / "original.bin"
+        enc = tmp_path / "encrypted.bin"
+        original_data = os.urandom(1024 * 100)
+        src.write_bytes(original_data)
+
+        wrapped_key, _ = encrypt_file(str(src), str(enc))
+        streamed = b"".join(decrypt_file_stream(str(enc), wrapped_key))
+        assert streamed == original_data
+
+    def test_stream_tampered_tag_raises(self, tmp_path):
+        """A flipped tag byte must abort the stream, not complete it."""
+        src = tmp_path / "original.bin"
+        enc = tmp_path / "encrypted.bin"
+        src.write_bytes(os.urandom(1024 * 100))
+
+        wrapped_key, _ = encrypt_file(str(src), str(enc))
+        tampered = bytearray(enc.read_bytes())
+        tampered[-1] ^= 0xFF  # last byte is inside the 16-byte GCM tag
+        enc.write_bytes(bytes(tampered))
+
+        with pytest.raises(InvalidTag):
+            b"".join(decrypt_file_stream(str(enc), wrapped_key))
+
+    def test_stream_tampered_ciphertext_raises(self, tmp_path):
+        """Corruption in the ciphertext body is also caught by the tag."""
+        src = tmp_path / "original.bin"
+        enc = tmp_path / "encrypted.bin"
+        src.write_bytes(os.urandom(1024 * 100))
+
+        wrapped_key, _ = encrypt_file(str(src), str(enc))
+        tampered = bytearray(enc.read_bytes())
+        tampered[len(tampered) // 2] ^= 0xFF
+        enc.write_bytes(bytes(tampered))
+
+        with pytest.raises(InvalidTag):
+            b"".join(decrypt_file_stream(str(enc), wrapped_key))
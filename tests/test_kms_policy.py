@@ -15,7 +15,8 @@ from app.kms import (
 )
 from app.policy import (
     PolicyType, AccessDecision, PolicyContext, evaluate_policy,
-    check_access, create_policy, Policy, share_file
+    check_access, create_policy, Policy, share_file, revoke_share,
+    PolicyAllowedUser, _evaluate_custom_rule
 )
 
 
@@ -84,8 +85,8 @@ class TestShamirSecretSharing:
         shares = split_secret(secret, n=5, k=3)
         
         assert len(shares) == 5
-        # Each share is 2 bytes per secret byte (to handle values 0-256)
-        assert all(len(s[1]) == len(secret) * 2 for s in shares)
+        # GF(2^8) shares are one byte per secret byte
+        assert all(len(s[1]) == len(secret) for s in shares)
         
         # Reconstruct with exactly threshold shares
         reconstructed = reconstruct_secret(shares[:3], len(secret))
@@ -265,6 +266,38 @@ class TestPolicyEngine:
             assert allowed
             assert "share" in reason.lower()
     
+    def test_share_and_revoke_association_rows(self, app, setup_users, setup_file):
+        """Share grants live as policy_allowed_users rows; revoking deletes
+        the row and the access it granted."""
+        with app.app_context():
+            policy = share_file(setup_file, setup_users["user1"], [setup_users["user2"]])
+
+            rows = PolicyAllowedUser.query.filter_by(policy_id=policy.id).all()
+            assert [r.user_id for r in rows] == [setup_users["user2"]]
+            assert policy.get_allowed_users() == [setup_users["user2"]]
+
+            revoke_share(setup_file, setup_users["user2"])
+
+            assert PolicyAllowedUser.query.filter_by(policy_id=policy.id).count() == 0
+            allowed, _ = check_access(
+                user_id=setup_users["user2"],
+                user_role="user",
+                file_id=setup_file,
+                file_owner_id=setup_users["user1"],
+                action="decrypt"
+            )
+            assert not allowed
+
+    def test_reshare_keeps_existing_grants(self, app, setup_users, setup_file):
+        """Sharing again inserts only the grants that are missing."""
+        with app.app_context():
+            policy = share_file(setup_file, setup_users["user1"], [setup_users["user2"]])
+            again = share_file(setup_file, setup_users["user1"],
+                               [setup_users["user2"], setup_users["admin"]])
+            assert again.id == policy.id
+            assert sorted(policy.get_allowed_users()) == sorted(
+                [setup_users["user2"], setup_users["admin"]])
+
     def test_time_limited_policy_valid(self, app, setup_users, setup_file):
         """Time-limited policy should work within expiry."""
         with app.app_context():
@@ -335,6 +368,105 @@ class TestPolicyEngine:
             assert allowed
 
 
+# ---------------------------------------------------------------------------
+# Custom Rule Sandbox Tests
+# ---------------------------------------------------------------------------
+class TestCustomRuleSandbox:
+    """The AST whitelist behind CUSTOM policies is a security boundary —
+    only names, constants, boolean logic and comparisons may appear."""
+
+    def _context(self, **overrides):
+        defaults = dict(
+            user_id=2, user_role="user", file_id=1,
+            file_owner_id=1, action="view"
+        )
+        defaults.update(overrides)
+        return PolicyContext(**defaults)
+
+    def test_comparison_rule_passes(self):
+        """Simple comparisons against context variables evaluate."""
+        decision, reason = _evaluate_custom_rule(
+            "user_id == 2", self._context(user_id=2))
+        assert decision == AccessDecision.ALLOW
+
+        decision, _ = _evaluate_custom_rule(
+            "user_id == 2", self._context(user_id=3))
+        assert decision == AccessDecision.DENY
+
+    def test_boolean_logic_rule_passes(self):
+        """and / or / not combine comparisons as documented."""
+        rule = "user_role == 'admin' or (is_owner and action == 'view')"
+        decision, _ = _evaluate_custom_rule(
+            rule, self._context(user_id=1, file_owner_id=1))
+        assert decision == AccessDecision.ALLOW
+
+        decision, _ = _evaluate_custom_rule(
+            "not is_admin and action != 'delete'", self._context())
+        assert decision == AccessDecision.ALLOW
+
+    def test_function_calls_rejected(self):
+        """Calls — including __import__ — fail compilation, not evaluation."""
+        decision, reason = _evaluate_custom_rule(
+            "__import__('os').system('id') == 0", self._context())
+        assert decision == AccessDecision.DENY
+        assert reason == "Invalid custom rule expression"
+
+    def test_attribute_access_rejected(self):
+        """Attribute access cannot be used to walk out of the sandbox."""
+        decision, reason = _evaluate_custom_rule(
+            "user_role.__class__ == str", self._context())
+        assert decision == AccessDecision.DENY
+        assert reason == "Invalid custom rule expression"
+
+    def test_subscript_rejected(self):
+        """Subscripting is outside the whitelisted grammar."""
+        decision, reason = _evaluate_custom_rule(
+            "user_role[0] == 'a'", self._context())
+        assert decision == AccessDecision.DENY
+        assert reason == "Invalid custom rule expression"
+
+    def test_invalid_rule_grants_nothing_via_policy(self, app, setup_users, setup_file):
+        """A CUSTOM policy whose rule fails compilation never grants access,
+        even if the rule text would have evaluated truthy."""
+        with app.app_context():
+            create_policy(
+                media_id=setup_file,
+                policy_type=PolicyType.CUSTOM,
+                created_by=setup_users["user1"],
+                rule_expression=f"int('{setup_users['user2']}') == user_id",
+                priority=10
+            )
+            allowed, _ = check_access(
+                user_id=setup_users["user2"],
+                user_role="user",
+                file_id=setup_file,
+                file_owner_id=setup_users["user1"],
+                action="decrypt"
+            )
+            assert not allowed
+
+    def test_valid_rule_allows_via_policy(self, app, setup_users, setup_file):
+        """A whitelisted CUSTOM rule grants a non-owner access through
+        check_access."""
+        with app.app_context():
+            create_policy(
+                media_id=setup_file,
+                policy_type=PolicyType.CUSTOM,
+                created_by=setup_users["user1"],
+                rule_expression=f"user_id == {setup_users['user2']} and action == 'decrypt'",
+                priority=10
+            )
+            allowed, reason = check_access(
+                user_id=setup_users["user2"],
+                user_role="user",
+                file_id=setup_file,
+                file_owner_id=setup_users["user1"],
+                action="decrypt"
+            )
+            assert allowed
+            assert "Custom rule passed" in reason
+
+
 # ---------------------------------------------------------------------------
 # Integration Tests
 # ---------------------------------------------------------------------------
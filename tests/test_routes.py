@@ -65,6 +65,29 @@ class TestAuth:
         rv = client.get("/auth/logout", follow_redirects=True)
         assert b"logged out" in rv.data.lower()
 
+    def test_login_throttled_after_repeated_failures(self, client):
+        from app.auth import routes as auth_routes
+        _register(client)
+        _register(client, username="other", email="other@example.com")
+        # Throttle state is module-level and survives across test apps
+        auth_routes._failed_logins.clear()
+        try:
+            for _ in range(auth_routes._FAILED_MAX):
+                rv = _login(client, password="wrong")
+                assert rv.status_code == 200
+            rv = _login(client, password="wrong")
+            assert rv.status_code == 429
+            # Even the correct password is refused while throttled
+            rv = _login(client)
+            assert rv.status_code == 429
+            # Buckets are per (IP, email) — another account from the same
+            # address is unaffected
+            rv = _login(client, email="other@example.com")
+            assert rv.status_code == 200
+            assert b"Too many failed login" not in rv.data
+        finally:
+            auth_routes._failed_logins.clear()
+
 
 class TestMediaUploadDownload:
     def test_upload_requires_login(self, client):
@@ -1,6 +1,22 @@
 # ── SecureMedia — WSGI entry point for Gunicorn ──
-"""Production entry-point used by Gunicorn / Docker."""
+"""Production entry-point used by Gunicorn / Docker.
+
+Runs under sync workers with threads (see Dockerfile CMD). A gevent
+worker was tried and reverted: monkey-patching doesn't make psycopg2's C
+calls cooperative without psycogreen, and it turns the background-task
+ThreadPoolExecutor's threads into greenlets — so a CPU-bound watermark
+embed would pin the worker's only OS thread and starve every request
+(including /health) on it. Native threads keep that work off the request
+path with the GIL released inside numpy/OpenCV/ffmpeg.
+"""
+
+from werkzeug.middleware.proxy_fix import ProxyFix
 
 from app import create_app
 
 app = create_app("config.ProductionConfig")
+
+# One trusted proxy hop (the compose nginx container): without this every
+# request carries nginx's address as remote_addr, which breaks anything
+# keyed on client IP (e.g. the login throttle) and the https URL scheme.
+app.wsgi_app = ProxyFix(app.wsgi_app, x_for=1, x_proto=1)